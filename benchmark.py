@@ -0,0 +1,230 @@
+"""Benchmarks for the conversion pipeline.
+
+    python benchmark.py                          # word, sentence and 1mb corpora
+    python benchmark.py --sizes 1mb,100mb        # pick corpus sizes
+    python benchmark.py --save-baseline          # store results as the baseline
+    python benchmark.py --threshold 0.15         # fail on a >15% throughput drop
+
+Each stage is timed on its own, on a synthetic corpus (random glyphs) and a
+realistic one (common words and punctuation), and reports throughput in
+characters per second plus the peak memory of one run. When a baseline file
+exists, any stage slower than the baseline by more than the threshold fails
+the run.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import converter
+import util
+from interpreter import get_default_converter, map_input_string
+from transducer import get_default_transducer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "benchmark_baseline.json")
+
+SIZES = {
+    "word": 6,
+    "sentence": 80,
+    "1mb": 1024 * 1024,
+    "100mb": 100 * 1024 * 1024,
+}
+DEFAULT_SIZES = "word,sentence,1mb"
+
+# Common words in Bijoy (SutonnyMJ) encoding
+WORDS = (
+    "Avwg Zzwg Avgiv evsjv †`k fvlv gvby‡li Rb¨ K‡i n‡e wQj GB Av‡Q †h bv Ges wK mKj cÖ_g wbe©vPb "
+    "miKvi Dchy³ ev½vwj cvwb ¯‹zj QvÎ Kw¤úDUvi eB c‡o Mvb †Zvgvi Kv‡R GKwU w`b ivZ Av‡jv b`x MÖvg "
+    "kni cwievi fv‡jv ¯^vaxbZv ag© Kg© c„w_ex"
+).split()
+PUNCTUATION = ["", "", "", "", ",", "|", "?"]
+
+# Minimum time spent on one measurement, and how many measurements to take the best of
+MIN_TIME = 0.2
+REPEAT = 3
+
+
+def realistic_bijoy(size, rnd):
+    parts = []
+    length = 0
+    while length < size:
+        word = rnd.choice(WORDS) + rnd.choice(PUNCTUATION)
+        parts.append(word)
+        length += len(word) + 1
+        if rnd.random() < 0.05:
+            parts.append("\n")
+    return " ".join(parts)[:size]
+
+
+def synthetic(size, alphabet, rnd):
+    return "".join(rnd.choice(alphabet) for _ in range(size))
+
+
+def keystrokes_for(bijoy_text, key_map):
+    """Spell Bijoy text as the single keys that type each glyph, where there is one."""
+    keys = {}
+    for key, value in key_map.items():
+        if len(key) == 1 and len(value) == 1:
+            keys.setdefault(value, key)
+    return "".join(keys.get(char, char) for char in bijoy_text)
+
+
+def build_corpora(size, seed=0):
+    """Inputs for every stage: {corpus kind: {"keys", "bijoy", "mapped", "unicode"}}."""
+    rnd = random.Random(seed)
+    key_map = get_default_converter().key_map
+    bijoy_alphabet = [key for key in converter.conversionMap if len(key) == 1] + [" "] * 20
+    key_alphabet = [key for key in key_map if len(key) == 1] + [" "] * 20
+
+    corpora = {}
+    for kind in ("synthetic", "realistic"):
+        if kind == "synthetic":
+            bijoy = synthetic(size, bijoy_alphabet, rnd)
+            keys = synthetic(size, key_alphabet, rnd)
+        else:
+            bijoy = realistic_bijoy(size, rnd)
+            keys = keystrokes_for(bijoy, key_map)
+        mapped = converter.conversion(converter.specialJuktoConversion(converter.preConversion(bijoy)))
+        unicode = converter.postConversion(converter.Unicode().reArrangeUnicodeConvertedText(mapped))
+        corpora[kind] = {"keys": keys, "bijoy": bijoy, "mapped": mapped, "unicode": unicode}
+    return corpora
+
+
+def build_stages():
+    """{name: (corpus field, function)} for every stage that is timed."""
+    bijoy_converter = get_default_converter()
+    transducer = get_default_transducer()
+    unicode = bijoy_converter.unicode
+    charMaps = [converter.preConversionMap, converter.specialJuktoConversionMap, converter.conversionMap]
+    stages = [converter.preConversion, converter.specialJuktoConversion, converter.conversion]
+
+    def do_char_map(text):
+        for charMap in charMaps:
+            text = util.doCharMap(text, charMap)
+        return text
+
+    def compiled_char_map(text):
+        for stage in stages:
+            text = stage(text)
+        return text
+
+    return {
+        "map_input_string": ("keys", lambda text: map_input_string(text, bijoy_converter.key_trie)),
+        "transducerKeys": ("keys", transducer.map_keys),
+        "doCharMap": ("bijoy", do_char_map),
+        "compiledCharMap": ("bijoy", compiled_char_map),
+        "transducerCharMap": ("bijoy", transducer.map_bijoy),
+        "reArrangeUnicodeConvertedText": ("mapped", unicode.reArrangeUnicodeConvertedText),
+        "interpreter": ("keys", bijoy_converter.convert),
+        "transducer": ("keys", transducer.convert),
+        "convertUnicodeToBijoy": ("unicode", unicode.convertUnicodeToBijoy),
+    }
+
+
+def time_call(function, text):
+    """Best seconds per call over REPEAT measurements of at least MIN_TIME each."""
+    best = float("inf")
+    for _ in range(REPEAT):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            function(text)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_TIME:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+
+def peak_memory(function, text):
+    tracemalloc.start()
+    try:
+        function(text)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, stage_names=None, memory=True):
+    stages = build_stages()
+    results = {}
+    for size_name in sizes:
+        corpora = build_corpora(SIZES[size_name])
+        for kind, corpus in corpora.items():
+            for name, (field, function) in stages.items():
+                if stage_names and name not in stage_names:
+                    continue
+                text = corpus[field]
+                seconds = time_call(function, text)
+                key = f"{name}/{kind}/{size_name}"
+                results[key] = {
+                    "chars": len(text),
+                    "seconds": seconds,
+                    "chars_per_sec": len(text) / seconds if seconds else float("inf"),
+                    "peak_bytes": peak_memory(function, text) if memory else None,
+                }
+                report(key, results[key])
+    return results
+
+
+def report(key, result):
+    peak = result["peak_bytes"]
+    peak = f"{peak / 1024:10.0f} KiB" if peak is not None else ""
+    print(f"{key:48} {result['chars_per_sec']:14,.0f} chars/s {peak}", flush=True)
+
+
+def compare(results, baseline, threshold):
+    """Return a message for every benchmark that is slower than baseline by more than threshold."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]["chars_per_sec"]
+        after = result["chars_per_sec"]
+        if after < before * (1 - threshold):
+            regressions.append(f"{key}: {after:,.0f} chars/s vs baseline {before:,.0f} ({after / before - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Bijoy conversion pipeline")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated from {', '.join(SIZES)}")
+    parser.add_argument("--stages", help="comma-separated stage names (default: all)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed throughput drop (default: 0.2)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak-memory runs")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes.split(",")
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown size: {', '.join(unknown)}")
+    stage_names = args.stages.split(",") if args.stages else None
+
+    results = run(sizes, stage_names, not args.no_memory)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --save-baseline first")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
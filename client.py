@@ -0,0 +1,172 @@
+"""Thin client for server.py.
+
+    from client import ConversionClient
+
+    with ConversionClient() as client:              # or ConversionClient(path="/tmp/bijoy.sock")
+        client.convert("Avwg")                      # 'আমি'
+        client.convert_many(["Avwg", "Zzwg"])
+        client.convert("Avwg", op="keys")           # keystrokes; op="to_bijoy" goes back
+
+    python client.py < legacy.txt > unicode.txt     # one request per input line
+    python client.py --check                        # against a server of its own
+"""
+import itertools
+import json
+import socket
+import sys
+
+# Where server.py listens unless told otherwise
+DEFAULT_PORT = 8765
+
+
+class ConversionError(Exception):
+    """The server answered a request with an error."""
+
+
+class ConversionClient:
+    """One connection to the conversion server; not for use from several threads at once."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, path=None, timeout=30.0):
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout)
+        self.file = self.socket.makefile("rwb")
+        self.ids = itertools.count(1)
+
+    def send(self, request):
+        request["id"] = next(self.ids)
+        self.file.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        return request["id"]
+
+    def receive(self):
+        """The next response, errors included; raising here would leave the rest of a pipeline unread."""
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("conversion server closed the connection")
+        return json.loads(line)
+
+    def request(self, request):
+        request_id = self.send(request)
+        self.file.flush()
+        response = self.receive()
+        if response["id"] != request_id:
+            raise ConversionError(f"answer to request {response['id']} while waiting for {request_id}")
+        if "error" in response:
+            raise ConversionError(response["error"])
+        return response
+
+    def convert(self, text, op="convert"):
+        return self.request({"op": op, "text": text})["text"]
+
+    def convert_many(self, texts, op="convert"):
+        """Convert a list of texts in one request."""
+        return self.request({"op": op, "texts": list(texts)})["texts"]
+
+    def convert_pipelined(self, texts, op="convert", window=256):
+        """Convert each text as its own request, up to window of them in flight; yields results in order.
+
+        The server batches requests that arrive together, so this is the fast
+        way to push many small texts through one connection. A failed text
+        raises ConversionError once its whole window has been answered, so the
+        connection can still be used.
+        """
+        texts = iter(texts)
+        while True:
+            pending = [self.send({"op": op, "text": text}) for text in itertools.islice(texts, window)]
+            if not pending:
+                return
+            self.file.flush()
+            results = {}
+            for _ in pending:
+                response = self.receive()
+                results[response["id"]] = response
+            for request_id in pending:
+                if "error" in results[request_id]:
+                    raise ConversionError(results[request_id]["error"])
+                yield results[request_id]["text"]
+
+    def stats(self):
+        return self.request({"op": "stats"})["stats"]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check():
+    """Start a server on a temporary socket and fail a pipelined text on it; returns the failures.
+
+    The connection must still answer the next call: the failure comes with
+    other answers in flight, and leaving them unread would hand them to it.
+    """
+    import asyncio
+    import os
+    import tempfile
+    import threading
+
+    from server import ConversionServer
+
+    failures = []
+    path = os.path.join(tempfile.mkdtemp(), "check.sock")
+    server = ConversionServer(workers=1)
+    ready = threading.Event()
+    threading.Thread(target=asyncio.run, args=(server.serve(path=path, ready=lambda _: ready.set()),),
+                     daemon=True).start()
+    try:
+        if not ready.wait(30):
+            return ["the server did not start"]
+        with ConversionClient(path=path) as client:
+            results = []
+            try:
+                results.extend(client.convert_pipelined(["Avwg", 5, "Zzwg"]))
+                failures.append("a text that is not a string was converted")
+            except ConversionError:
+                pass
+            if results != ["আমি"]:
+                failures.append(f"the texts before the failure gave {results!r}")
+            try:
+                text = client.convert("evsjv")
+            except ConversionError as e:
+                text = e
+            if text != "বাংলা":
+                failures.append(f"the next call on the connection gave {text!r}")
+    finally:
+        server.close()
+        os.remove(path)
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+    import io
+
+    parser = argparse.ArgumentParser(description="Convert stdin through a running conversion server")
+    parser.add_argument("--socket", metavar="PATH")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--op", choices=["convert", "keys", "to_bijoy"], default="convert")
+    parser.add_argument("--check", action="store_true",
+                        help="start a server of its own and check that a failed request leaves the connection usable")
+    args = parser.parse_args()
+
+    if args.check:
+        failures = check()
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1 if failures else 0)
+
+    reader = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    writer = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    with ConversionClient(args.host, args.port, args.socket) as client:
+        for text in client.convert_pipelined(reader, args.op):
+            writer.write(text)
+    writer.flush()
@@ -0,0 +1,97 @@
+"""Clipboard backends for the paste injectors.
+
+Every backend has the pyperclip interface, copy(text) and paste(), so the
+pyperclip module itself, FakeClipboard and the classes here are interchangeable.
+"""
+import threading
+
+
+class PyperclipClipboard:
+    """pyperclip as is; on Linux every call starts an xclip/xsel process."""
+
+    def __init__(self):
+        import pyperclip
+
+        self.pyperclip = pyperclip
+
+    def copy(self, text):
+        self.pyperclip.copy(text)
+
+    def paste(self):
+        return self.pyperclip.paste()
+
+    def close(self):
+        pass
+
+
+class TkClipboard:
+    """Owns the clipboard from one long-lived hidden Tk window.
+
+    The window's event loop answers paste requests from other applications,
+    so copying is an in-process call instead of a new xclip/xsel process.
+    Needs a Tcl built with thread support, which lets other threads call into
+    the loop's thread.
+    """
+
+    def __init__(self, timeout=2.0):
+        self.root = None
+        self.error = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            raise RuntimeError("Tk clipboard did not start")
+        if self.error is not None:
+            raise RuntimeError(f"Tk clipboard unavailable: {self.error}")
+
+    def run(self):
+        try:
+            import tkinter
+
+            self.tclerror = tkinter.TclError
+            root = tkinter.Tk()
+            root.withdraw()
+            if not root.tk.eval("info exists tcl_platform(threaded)") == "1":
+                root.destroy()
+                raise RuntimeError("Tcl is not built with threads")
+            self.root = root
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        self.root.mainloop()
+
+    def copy(self, text):
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+
+    def paste(self):
+        try:
+            return self.root.clipboard_get()
+        except self.tclerror:
+            return ""
+
+    def close(self):
+        if self.root is not None:
+            self.root.after(0, self.root.quit)
+
+
+BACKENDS = {
+    "pyperclip": PyperclipClipboard,
+    "tk": TkClipboard,
+}
+
+
+def create_clipboard(name="pyperclip", debug=False):
+    """The named backend, falling back to pyperclip if it cannot start."""
+    if name == "fake":
+        from fakes import FakeClipboard
+
+        return FakeClipboard()
+    try:
+        return BACKENDS[name]()
+    except RuntimeError as e:
+        if debug:
+            print(f"{e}; falling back to pyperclip")
+        return PyperclipClipboard()
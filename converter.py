@@ -247,249 +247,337 @@ postConversionMap = {
     '্‌্‌': '্‌'
 }
 
+charMaps = {
+    'preConversion': preConversionMap,
+    'specialJuktoConversion': specialJuktoConversionMap,
+    'conversion': conversionMap,
+    'proConversion': proConversionMap,
+    'postConversion': postConversionMap
+}
+
+def planCharMaps():
+    return {name: util.planCharMap(charMap) for name, charMap in charMaps.items()}
+
+# the analysis behind the compiled maps is cached on disk until one of the maps changes
+def loadCharMapPlans(rebuild=False):
+    return util.loadCached('charmaps', repr(charMaps), planCharMaps, rebuild)
+
+# every map is compiled once at import so each stage scans the text a single time
+charMapPlans = loadCharMapPlans()
+preConversion = util.charMapFromPlan(charMapPlans['preConversion'])
+specialJuktoConversion = util.charMapFromPlan(charMapPlans['specialJuktoConversion'])
+conversion = util.charMapFromPlan(charMapPlans['conversion'])
+proConversion = util.charMapFromPlan(charMapPlans['proConversion'])
+postConversion = util.charMapFromPlan(charMapPlans['postConversion'])
+
+# Unicode to Bijoy runs the conversion maps backwards. Each Unicode sequence
+# takes its shortest Bijoy spelling (the first listed on a tie), and values
+# that are plain ASCII punctuation are left as they are.
+def invertCharMaps(*charMaps):
+    inverted = {}
+    for charMap in charMaps:
+        for srcKey, keyVal in charMap.items():
+            key = srcKey.replace('\\', '')  # the keys are patterns: '\\|' is '|'
+            if keyVal.isascii():
+                continue
+            if keyVal not in inverted or len(key) < len(inverted[keyVal]):
+                inverted[keyVal] = key
+    return inverted
+
+unicodePreConversionMap = {
+    '\u09cb': '\u09c7\u09be', # O-Kar: the E-Kar half goes before the consonant
+    '\u09cc': '\u09c7\u09d7', # Ou-Kar
+    '\u09a1\u09bc': '\u09dc', # Nukta letters in the precomposed form the maps use
+    '\u09a2\u09bc': '\u09dd',
+    '\u09af\u09bc': '\u09df'
+}
+
+unicodeConversionMap = invertCharMaps(specialJuktoConversionMap, conversionMap)
+unicodeConversionMap.setdefault('্', '&') # a halant no conjunct took
+unicodeConversionMap.setdefault('\u09bc', '') # a nukta no precomposed letter took
+unicodeConversionMap.setdefault('৳', '$') # Bijoy fonts draw the taka sign on $
+# Joiners only steer how a font draws a conjunct; Bijoy has no code for them
+unicodeConversionMap.setdefault('\u200c', '')
+unicodeConversionMap.setdefault('\u200d', '')
+
+unicodePreConversion = util.compileCharMap(unicodePreConversionMap)
+_unicodeConversion = None
+
+def unicodeConversion(text):
+    # the longest-match pattern is only built the first time it is needed
+    global _unicodeConversion
+    if _unicodeConversion is None:
+        _unicodeConversion = util.longestMatchCharMap(unicodeConversionMap)
+    return _unicodeConversion(text)
+
+
+# Script properties the rearrangement rules test, as class bits per
+# character; anything not listed has none. A single dict lookup replaces the
+# chains of comparisons the checks used to be.
+DIGIT = 1
+PRE_KAR = 2
+POST_KAR = 4
+KAR = PRE_KAR | POST_KAR
+BANJONBORNO = 8
+CONSONANT = 16
+SOROBORNO = 32
+NUKTA = 64
+HALANT = 128
+SPACE = 256
+RA = 512
+
+def buildCharClasses():
+    classes = {}
+
+    def mark(chars, flags):
+        for c in chars:
+            classes[c] = classes.get(c, 0) | flags
+
+    mark('০১২৩৪৫৬৭৮৯', DIGIT)
+    mark('িৈে', PRE_KAR)
+    mark('াোৌৗুূীৃ', POST_KAR)
+    mark('কখগঘঙচছজঝঞটঠডঢণতথদধনপফবভমযরলশষসহৎংঃঁ', BANJONBORNO | CONSONANT)
+    # Banjonborno spells ড়, ঢ় and য় as two code points each, so they match
+    # whole but no single character of the text ever does; as consonants they
+    # are the precomposed letters
+    for pair in ('ড়', 'ঢ়', 'য়'):
+        classes[pair] = BANJONBORNO | CONSONANT
+    mark('ড়ঢ়য়', CONSONANT)
+    mark('অআইঈউঊঋঌএঐওঔ', SOROBORNO)
+    mark('ঁ', NUKTA)
+    mark('্', HALANT)
+    mark('র', RA)
+    mark(' \t\n\r', SPACE)
+    return classes
+
+charClasses = buildCharClasses()
+
 
 class Unicode:
 
     def IsBanglaDigit(self, c):
-        if (c >= '০' and c <= '৯'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & DIGIT)
 
     def IsBanglaPreKar(self, c):
-        if (c == 'ি' or c == 'ৈ' or c == 'ে'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & PRE_KAR)
 
     def IsBanglaPostKar(self, c):
-        if (c == 'া' or c == 'ো' or c == 'ৌ' or c == 'ৗ' or c == 'ু' or c == 'ূ' or c == 'ী' or c == 'ৃ'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & POST_KAR)
 
     def IsBanglaKar(self, c):
-        if (self.IsBanglaPreKar(c) or self.IsBanglaPostKar(c)):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & KAR)
 
     def IsBanglaBanjonborno(self, c):
-        if (c == 'ক' or c == 'খ' or c == 'গ' or c == 'ঘ' or c == 'ঙ' or c == 'চ' or c == 'ছ' or c == 'জ' or c == 'ঝ' or c == 'ঞ' or c == 'ট' or c == 'ঠ' or c == 'ড' or c == 'ঢ' or c == 'ণ' or c == 'ত' or c == 'থ' or c == 'দ' or c == 'ধ' or c == 'ন' or c == 'প' or c == 'ফ' or c == 'ব' or c == 'ভ' or c == 'ম' or c == 'য' or c == 'র' or c == 'ল' or c == 'শ' or c == 'ষ' or c == 'স' or c == 'হ' or c == 'ড়' or c == 'ঢ়' or c == 'য়' or c == 'ৎ' or c == 'ং' or c == 'ঃ' or c == 'ঁ'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & BANJONBORNO)
+
+    # converting to Bijoy needs the precomposed ড় ঢ় য় counted as well
+    def IsBanglaConsonant(self, c):
+        return bool(charClasses.get(c, 0) & CONSONANT)
 
     def IsBanglaSoroborno(self, c):
-        if (c == 'অ' or c == 'আ' or c == 'ই' or c == 'ঈ' or c == 'উ' or c == 'ঊ' or c == 'ঋ' or c == 'ঌ' or c == 'এ' or c == 'ঐ' or c == 'ও' or c == 'ঔ'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & SOROBORNO)
 
     def IsBanglaNukta(self, c):
-        if (c == 'ঁ'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & NUKTA)
 
     def IsBanglaHalant(self, c):
-        if (c == '্'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & HALANT)
 
     def IsSpace(self, c):
-        if (c == ' ' or c == '\t' or c == '\n' or c == '\r'):
-            return True
-        return False
+        return bool(charClasses.get(c, 0) & SPACE)
+
+    # index of the first character that moves behind a ref (র্) found at i
+    def refClusterStart(self, buf, i):
+        cls = charClasses.get
+        j = 1
+        while (True):
+            if (i - j < 0):
+                break
+
+            if (cls(buf.charAt(i - j), 0) & BANJONBORNO and cls(buf.charAt(i - j - 1), 0) & HALANT):
+                j += 2
+            elif (j == 1 and cls(buf.charAt(i - j), 0) & KAR):
+                j += 1
+            else:
+                break
+        return i - j
+
+    # moves the ref at i in front of its cluster and returns the buffer to keep using
+    def moveRef(self, buf, i):
+        start = self.refClusterStart(buf, i)
+        if start < 0:
+            # the cluster walked past the start of the text, where negative
+            # indices wrap around; rebuild the string exactly as slicing would
+            str = buf.toString()
+            temp = util.subString(str, 0, start)
+            temp += util.mbCharAt(str, i)
+            temp += util.mbCharAt(str, i + 1)
+            temp += util.subString(str, start, i)
+            temp += util.subString(str, i + 2, util.mb_strlen(str))
+            return util.GapBuffer(temp)
+
+        buf.replace(start, i + 2, [buf.charAt(i), buf.charAt(i + 1)] + buf.slice(start, i))
+        return buf
 
     def reArrangeUnicodeConvertedText(self, str):
+        # the rules only touch a few characters around i, so they edit a gap
+        # buffer in place instead of rebuilding the whole string for each one
+        buf = util.GapBuffer(str)
+        at = buf.charAt
+        cls = charClasses.get
+
+        #  Change refs
+        i = 0
+        while i < len(buf):
+            if (cls(at(i), 0) & RA and i < len(buf) - 1 and cls(at(i + 1), 0) & HALANT and cls(at(i - 1), 0) & HALANT):
+                buf = self.moveRef(buf, i)
+                at = buf.charAt
+            i += 1
 
-        #mb_internal_encoding("UTF-8") # force multi-byte UTF-8 encoding
+        buf = util.GapBuffer(proConversion(buf.toString()))
+        at = buf.charAt
 
-        #global proConversionMap
+        # every rule starts at one of these; anything else is stepped over
+        rules = RA | HALANT | PRE_KAR | NUKTA
 
-        #for (i = 0; i < mb_strlen(str); ++i) 
         i = 0
-        while i < util.mb_strlen(str):
-            #  Change refs
-            if (i < (util.mb_strlen(str) - 1) and util.mbCharAt(str, i) == 'র' and self.IsBanglaHalant(util.mbCharAt(str, i + 1)) and self.IsBanglaHalant(util.mbCharAt(str, i - 1))):
-                j = 1
-                while (True):
-                    if (i - j < 0):
-                        break
-                    
-                    if (self.IsBanglaBanjonborno(util.mbCharAt(str, i - j)) and self.IsBanglaHalant(util.mbCharAt(str, i - j - 1))): 
-                        j += 2
-                    elif (j == 1 and self.IsBanglaKar(util.mbCharAt(str, i - j))):
-                        j += 1
-                    else:
-                        break
-                    
-                
-                temp = util.subString(str, 0, i - j)
-                temp += util.mbCharAt(str, i)
-                temp += util.mbCharAt(str, i + 1)
-                temp += util.subString(str, i - j, i)
-                temp += util.subString(str, i + 2, util.mb_strlen(str))
-                str = temp
+        while i < len(buf):
+            c = at(i)
+            if not cls(c, 0) & rules:
                 i += 1
                 continue
 
-            i += 1
-
-        str = util.doCharMap(str, proConversionMap)
-
-        #for (i = 0 i < mb_strlen(str) ++i) 
-        i=0
-        while i<util.mb_strlen(str):
-            if (i < util.mb_strlen(str) - 1 and util.mbCharAt(str, i) == 'র' and self.IsBanglaHalant(util.mbCharAt(str, i + 1)) and not self.IsBanglaHalant(util.mbCharAt(str, i - 1)) and self.IsBanglaHalant(util.mbCharAt(str, i + 2))):
-                j = 1
-                while (True):
-                    if (i - j < 0):
-                        break
-                    
-                    if (self.IsBanglaBanjonborno(util.mbCharAt(str, i - j)) and self.IsBanglaHalant(util.mbCharAt(str, i - j - 1))):
-                        j += 2
-                    elif (j == 1 and self.IsBanglaKar(util.mbCharAt(str, i - j))):
-                        j += 1
-                    else:
-                        break
-                    
-                
-                temp = util.subString(str, 0, i - j)
-                temp += util.mbCharAt(str, i)
-                temp += util.mbCharAt(str, i + 1)
-                temp += util.subString(str, i - j, i)
-                temp += util.subString(str, i + 2, util.mb_strlen(str))
-                str = temp
+            if (cls(c, 0) & RA and i < len(buf) - 1 and cls(at(i + 1), 0) & HALANT and not cls(at(i - 1), 0) & HALANT and cls(at(i + 2), 0) & HALANT):
+                buf = self.moveRef(buf, i)
+                at = buf.charAt
                 i += 1
                 continue
-            
-
-            #  for 'Vowel + HALANT + Consonant' it should be 'HALANT + Consonant + Vowel'
-            if (i > 0 and util.mbCharAt(str, i) == '\u09CD' and (self.IsBanglaKar(util.mbCharAt(str, i - 1)) or self.IsBanglaNukta(util.mbCharAt(str, i - 1))) and i < util.mb_strlen(str) - 1):
-                temp = util.subString(str, 0, i - 1)
-                temp += util.mbCharAt(str, i)
-                temp += util.mbCharAt(str, i + 1)
-                temp += util.mbCharAt(str, i - 1)
-                temp += util.subString(str, i + 2, util.mb_strlen(str))
-                str = temp
-            
-
-            #  for 'RA (\u09B0) + HALANT + Vowel' it should be 'Vowel + RA (\u09B0) + HALANT'
-            if (i > 0 and i < util.mb_strlen(str) - 1 and util.mbCharAt(str, i) == '\u09CD' and util.mbCharAt(str, i - 1) == '\u09B0' and util.mbCharAt(str, i - 2) != '\u09CD' and self.IsBanglaKar(util.mbCharAt(str, i + 1))):
-                temp = util.subString(str, 0, i - 1)
-                temp += util.mbCharAt(str, i + 1)
-                temp += util.mbCharAt(str, i - 1)
-                temp += util.mbCharAt(str, i)
-                temp += util.subString(str, i + 2, util.mb_strlen(str))
-                str = temp            
 
-            #  Change pre-kar to post format suitable for unicode
-            if (i < util.mb_strlen(str) - 1 and self.IsBanglaPreKar(util.mbCharAt(str, i)) and self.IsSpace(util.mbCharAt(str, i + 1)) == False):
-                
-                temp = util.subString(str, 0, i)
+            if (cls(c, 0) & HALANT and i > 0 and i < len(buf) - 1):
+                #  for 'Vowel + HALANT + Consonant' it should be 'HALANT + Consonant + Vowel'
+                prev = at(i - 1)
+                if (cls(prev, 0) & (KAR | NUKTA)):
+                    buf.replace(i - 1, i + 2, [c, at(i + 1), prev])
+                    c = at(i)
 
+                #  for 'RA (\u09B0) + HALANT + Vowel' it should be 'Vowel + RA (\u09B0) + HALANT'
+                if (c == '\u09CD' and at(i - 1) == '\u09B0' and at(i - 2) != '\u09CD' and cls(at(i + 1), 0) & KAR):
+                    buf.replace(i - 1, i + 2, [at(i + 1), '\u09B0', c])
+                    c = at(i)
+
+            #  Change pre-kar to post format suitable for unicode
+            n = len(buf)
+            if (i < n - 1 and cls(c, 0) & PRE_KAR and not cls(at(i + 1), 0) & SPACE):
                 j = 1
-                while ((i + j) < util.mb_strlen(str) - 1 and self.IsBanglaBanjonborno(util.mbCharAt(str, i + j))):
-                    if ((i + j) < util.mb_strlen(str) and self.IsBanglaHalant(util.mbCharAt(str, i + j + 1))):
+                while ((i + j) < n - 1 and cls(at(i + j), 0) & BANJONBORNO):
+                    if ((i + j) < n and cls(at(i + j + 1), 0) & HALANT):
                         j += 2
                     else:
-                        break                    
-                
-                temp += util.subString(str, i + 1, i + j + 1)
-
-                l = 0
-                if (util.mbCharAt(str, i) == 'ে' and util.mbCharAt(str, i + j + 1) == 'া'):
-                    temp += "ো"
-                    l = 1
-                elif (util.mbCharAt(str, i) == 'ে' and util.mbCharAt(str, i + j + 1) == "ৗ"):
-                    temp += "ৌ"
-                    l = 1
+                        break
+
+                moved = buf.slice(i + 1, i + j + 1)
+                after = at(i + j + 1)
+                if (c == 'ে' and after == 'া'):
+                    buf.replace(i, i + j + 2, moved + ["ো"])
+                elif (c == 'ে' and after == "ৗ"):
+                    buf.replace(i, i + j + 2, moved + ["ৌ"])
                 else:
-                    temp += util.mbCharAt(str, i)
-                
-                temp += util.subString(str, i + j + l + 1, util.mb_strlen(str))
-                str = temp
+                    buf.replace(i, min(i + j + 1, n), moved + [c])
                 i += j
-            
+                c = at(i)
+
             #  nukta should be placed after kars
-            if (i < util.mb_strlen(str) - 1 and self.IsBanglaNukta(util.mbCharAt(str, i)) and self.IsBanglaPostKar(util.mbCharAt(str, i + 1))):
-                temp = util.subString(str, 0, i)
-                temp += util.mbCharAt(str, i + 1)
-                temp += util.mbCharAt(str, i)
-                temp += util.subString(str, i + 2, util.mb_strlen(str))
-                str = temp
+            if (cls(c, 0) & NUKTA and i < len(buf) - 1 and cls(at(i + 1), 0) & POST_KAR):
+                buf.replace(i, i + 2, [at(i + 1), c])
 
             i += 1
-        return str
+        return buf.toString()
 
     def reArranceUnicodeTextForASCI(self, str):
-        
+        # Bijoy order: pre-kars before their consonant cluster, refs after it.
+        # The loop steps past every move like the for loop it was ported from;
+        # staying on the spot carried a moved ref on to the end of the text and
+        # swapped two neighbouring pre-kars forever. Moves are local edits on a
+        # gap buffer, and positions before the start of the text are missing
+        # rather than wrapping around.
+        buf = util.GapBuffer(str)
+
+        def at(k):
+            return buf.charAt(k) if k >= 0 else None
+
+        cls = charClasses.get
+        n = len(buf)  # every move puts back as many characters as it takes
         cY = 0
         i = 0
-        
-        #for ($i = 0; $i < util.mb_strlen(str); ++$i) 
-        while i<util.mb_strlen(str):
+        while i < n:
+            c = at(i)
+            flags = cls(c, 0)
+            if not flags & (PRE_KAR | HALANT):
+                i += 1
+                continue
 
-            if(i<util.mb_strlen(str) and self.IsBanglaPreKar(util.mbCharAt(str,i))):
-                j=1
-                while self.IsBanglaBanjonborno(util.mbCharAt(str,i-j)):
-                    if (i-j)<0:
-                        break
-                    if (i-j)<=cY:
+            if flags & PRE_KAR:
+                j = 1
+                while cls(at(i - j), 0) & CONSONANT:
+                    if (i - j) <= cY:
                         break
-                    if self.IsBanglaHalant(util.mbCharAt(str,i-j-1)):
-                        j+=2
+                    if cls(at(i - j - 1), 0) & HALANT:
+                        j += 2
                     else:
                         break
 
-                R = util.subString(str,0, i-j)
-                R += util.mbCharAt(str,i)
-                R += util.subString(str,i-j, i)
-                R += util.subString(str,i+1, util.mb_strlen(str))
-                
-                str = R
-                
-                cY= i+1
+                if i - j >= 0:
+                    buf.replace(i - j, i + 1, [c] + buf.slice(i - j, i))
+                cY = i + 1
+                i += 1
                 continue
-            
-            
-            if i<(util.mb_strlen(str)-1) and self.IsBanglaHalant(util.mbCharAt(str,i)) and util.mbCharAt(str,i-1)=='র' and not self.IsBanglaHalant(util.mbCharAt(str,i-2)):
-                j=1
-                aZ=0
+
+            if i < n - 1 and flags & HALANT and cls(at(i - 1), 0) & RA and not cls(at(i - 2), 0) & HALANT:
+                j = 1
+                aZ = 0
 
                 while True:
-                    if self.IsBanglaBanjonborno(util.mbCharAt(str,i+j)) and self.IsBanglaHalant(util.mbCharAt(str,i+j+1)):
-                        j+=2
+                    if cls(at(i + j), 0) & CONSONANT and cls(at(i + j + 1), 0) & HALANT:
+                        j += 2
 
-                    elif self.IsBanglaBanjonborno(util.mbCharAt(str,i+j)) and self.IsBanglaPreKar(util.mbCharAt(str,i+j+1)):
-                        aZ=1
+                    elif cls(at(i + j), 0) & CONSONANT and cls(at(i + j + 1), 0) & PRE_KAR:
+                        aZ = 1
                         break
-                    
+
                     else:
                         break
 
-                R  = util.subString(str,0, i-1)
-                R += util.subString(str, i+j+1, i+j+aZ+1)
-                R += util.subString(str, i+1, i+j+1)
-                R += util.mbCharAt(str, i-1)
-                R += util.mbCharAt(str, i)
-                R += util.subString(str, i+j+aZ+1, util.mb_strlen(str))
-                
-                str = R
-                
-                i+=(j+aZ)
-                cY=i+1
+                moved = buf.slice(i + j + 1, i + j + aZ + 1) + buf.slice(i + 1, i + j + 1)
+                buf.replace(i - 1, min(i + j + aZ + 1, n), moved + ['র', c])
+
+                i += (j + aZ)
+                cY = i + 1
+                i += 1
                 continue
 
             i += 1
-        return str
+        return buf.toString()
 
     # main conversion def
     def convertBijoyToUnicode(self, srcString):
         if not srcString:
             return srcString
 
-        srcString = util.doCharMap(srcString, preConversionMap)
-        srcString = util.doCharMap(srcString, specialJuktoConversionMap)
-        srcString = util.doCharMap(srcString, conversionMap)
+        srcString = preConversion(srcString)
+        srcString = specialJuktoConversion(srcString)
+        srcString = conversion(srcString)
         
         srcString = self.reArrangeUnicodeConvertedText(srcString)
-        srcString = util.doCharMap(srcString, postConversionMap)
+        srcString = postConversion(srcString)
+        return srcString
+
+    def convertUnicodeToBijoy(self, srcString):
+        if not srcString:
+            return srcString
+
+        srcString = unicodePreConversion(srcString)
+        srcString = self.reArranceUnicodeTextForASCI(srcString)
+        srcString = unicodeConversion(srcString)
         return srcString
 
     def __init__(self):
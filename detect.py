@@ -0,0 +1,157 @@
+"""Tell Bijoy, Unicode Bengali and English apart line by line, so mixed text converts without sorting it first.
+
+    from detect import detect, convert_detected
+
+    detect("Avwg evsjvq Mvb MvB")        # "bijoy"
+    detect("The quick brown fox")        # "english"
+    "".join(convert_detected(open("archive.txt", encoding="utf-8")))
+
+    python main.py convert --detect archive.txt -o unicode.txt
+
+A line is scored from how often each class of character turns up in it:
+Bengali letters mean Unicode, and the glyphs Bijoy puts above ASCII (the keys
+of conversionMap outside it) mean Bijoy. ASCII letters are codes in Bijoy too,
+so for them the score is a log-likelihood ratio of the two letter mixes: Bijoy
+spells kars and most consonants with 'v', 'w' and capitals, English leans on
+vowels. A line with too little to go on (blank, digits, a word or two) takes
+the kind of the line before it. Only Bijoy lines are converted, and within
+them stream.convert_words still leaves Unicode words and links alone.
+"""
+import math
+from itertools import groupby
+
+import router
+import stream
+import util
+from converter import conversionMap, specialJuktoConversionMap
+
+BIJOY = router.BIJOY
+UNICODE = router.UNICODE
+ENGLISH = "english"
+
+# Share of each class among the ASCII letters, measured on common Bijoy words
+# and on English prose; C is a capital, a a lower-case vowel, l any other letter
+BIJOY_LETTERS = {"v": 0.20, "w": 0.08, "C": 0.22, "a": 0.15, "l": 0.35}
+ENGLISH_LETTERS = {"v": 0.01, "w": 0.02, "C": 0.05, "a": 0.37, "l": 0.55}
+LETTER_WEIGHTS = {c: math.log(BIJOY_LETTERS[c] / ENGLISH_LETTERS[c]) for c in BIJOY_LETTERS}
+
+# Evidence for Bijoy from one of its glyphs above ASCII, and the score a line needs either way
+HIGH_WEIGHT = 4.0
+MARGIN = 3.0
+
+# Marks English text uses as much as Bijoy text does
+NEUTRAL = "‘’‚“”–—…•\u200c\u200d"
+
+
+def class_table():
+    """A str.translate table from each character to its class letter.
+
+    Characters of no class are dropped, or kept as they are past the end of
+    the table; either way they count for nothing.
+    """
+    high = set()
+    for charMap in (specialJuktoConversionMap, conversionMap):
+        for srcKey in charMap:
+            high.update(c for c in util.literalPattern(srcKey) or srcKey if ord(c) > 127)
+    high.difference_update(NEUTRAL)
+
+    # A list indexed by code point translates faster than a dict
+    table = [None] * max(max(map(ord, high)) + 1, 0x0a00)
+    for c in "abcdefghijklmnopqrstuvwxyz":
+        table[ord(c)] = "a" if c in "aeiou" else "l"
+    for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+        table[ord(c)] = "C"
+    table[ord("v")] = "v"
+    table[ord("w")] = "w"
+    for c in high:
+        table[ord(c)] = "H"
+    # The taka sign is typed into Bijoy text as itself
+    for code in range(0x0980, 0x0a00):
+        table[code] = None if chr(code) == "৳" else "U"
+    return table
+
+
+_CLASSES = class_table()
+
+
+def score(line):
+    """(Bengali letters, evidence for Bijoy over English) in line.
+
+    Next to Bengali letters only Bijoy glyphs above ASCII count, since Unicode
+    text quotes English words (and acronyms) but never Bijoy codes.
+    """
+    classes = line.translate(_CLASSES)
+    bengali = classes.count("U")
+    evidence = HIGH_WEIGHT * classes.count("H")
+    if bengali:
+        return bengali, evidence
+    if 2 * classes.count("C") > len(classes):
+        # Bijoy never spells most of a line in capitals, English headings and notices do
+        classes = line.lower().translate(_CLASSES)
+    for c, weight in LETTER_WEIGHTS.items():
+        evidence += weight * classes.count(c)
+    return bengali, evidence
+
+
+def detect(line):
+    """BIJOY, UNICODE or ENGLISH, or None when line says too little to tell."""
+    bengali, evidence = score(line)
+    if bengali:
+        # Bijoy glyphs next to Bengali letters are a Bijoy line quoting some Unicode
+        return BIJOY if evidence >= HIGH_WEIGHT else UNICODE
+    if evidence >= MARGIN:
+        return BIJOY
+    if evidence <= -MARGIN:
+        return ENGLISH
+    return None
+
+
+def detect_runs(blocks, default=BIJOY, max_pending=stream.MAX_CHUNK_SIZE):
+    """Yield (kind, text) for the lines of an iterable of text blocks, consecutive lines of a kind together.
+
+    A line that cannot be told takes the kind of the line before it. Lines at
+    the start wait for the first one that can be told, or take default once
+    max_pending characters of them have piled up.
+    """
+    kind = None
+    run = []
+    waiting = 0
+    for block in blocks:
+        for line in block.splitlines(keepends=True):
+            line_kind = detect(line) or kind
+            if line_kind is None:
+                run.append(line)
+                waiting += len(line)
+                if waiting >= max_pending:
+                    kind = default
+                continue
+            if kind is not None and line_kind != kind and run:
+                yield kind, "".join(run)
+                run = []
+            kind = line_kind
+            run.append(line)
+        # Hand on what is known at the end of every block, so memory stays about a block
+        if run and kind is not None:
+            yield kind, "".join(run)
+            run = []
+    if run:
+        yield kind or default, "".join(run)
+
+
+def route(blocks, max_chunk_size=stream.MAX_CHUNK_SIZE):
+    """Yield (kind, text) for an iterable of text blocks, with BIJOY text in chunks ready to convert on their own."""
+    for kind, runs in groupby(detect_runs(stream.split_lines(blocks, max_chunk_size)), key=lambda run: run[0]):
+        texts = (text for _, text in runs)
+        if kind != BIJOY:
+            for text in texts:
+                yield kind, text
+            continue
+        # Cut only where the whole text would be cut, so Bijoy text converts as it does without detection
+        for chunk in stream.split_safe(texts, max_chunk_size):
+            yield kind, chunk
+
+
+def convert_detected(blocks, max_chunk_size=stream.MAX_CHUNK_SIZE):
+    """Convert the Bijoy lines of an iterable of text blocks and pass the rest through, yielding text in order."""
+    for kind, text in route(blocks, max_chunk_size):
+        yield stream.convert_words(text) if kind == BIJOY else text
@@ -0,0 +1,90 @@
+"""A converted document that follows edits to its source without converting it all again.
+
+    doc = ConvertedDocument(open("book.txt", encoding="utf-8").read())
+    doc.output                                  # the Unicode text
+    out_start, out_end, text = doc.edit(120, 125, "Avwg")
+    # the output changed from out_start to out_end (old positions) into text
+    doc.output_span(120, 124)                   # where source[120:124] ended up
+
+The source is kept as the pieces stream.split_words cuts it into, each of
+which converts on its own, with the start of every piece in the source and
+in the output. Whether a cut is safe depends only on the two characters
+before it and the one after, so an edit leaves every cut outside that reach
+valid; only the pieces between the nearest untouched cuts are converted
+again and spliced in.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+import stream
+
+
+class ConvertedDocument:
+    """Source text, its conversion and the offset map between them, kept in step by edit().
+
+    With reverse the source is Unicode and the output Bijoy text.
+    """
+
+    def __init__(self, source="", reverse=False):
+        self.reverse = reverse
+        self.source = source
+        self.output, offsets = stream.convert_words_with_offsets(source, reverse)
+        # Start of every piece in the source and in the output, 8 bytes each
+        self.source_starts = array("q", (start for start, _ in offsets))
+        self.output_starts = array("q", (start for _, start in offsets))
+
+    def __len__(self):
+        return len(self.source_starts)
+
+    def edit(self, start, end, text):
+        """Replace source[start:end] with text.
+
+        Returns (output start, output end, replacement): the output span, in
+        positions from before the edit, that changed and what it now holds.
+        """
+        source_starts = self.source_starts
+        output_starts = self.output_starts
+        delta = len(text) - (end - start)
+
+        # Redo from the last cut before the edit to the first one it cannot reach
+        first = max(bisect_left(source_starts, start) - 1, 0)
+        last = bisect_left(source_starts, end + 2)
+        source_from = source_starts[first] if len(source_starts) else 0
+        source_to = source_starts[last] if last < len(source_starts) else len(self.source)
+        output_from = output_starts[first] if len(output_starts) else 0
+        output_to = output_starts[last] if last < len(output_starts) else len(self.output)
+
+        self.source = self.source[:start] + text + self.source[end:]
+        region = self.source[source_from:source_to + delta]
+        converted, offsets = stream.convert_words_with_offsets(region, self.reverse)
+        self.output = self.output[:output_from] + converted + self.output[output_to:]
+
+        output_delta = len(converted) - (output_to - output_from)
+        source_starts[first:] = array("q", [source_from + s for s, _ in offsets] +
+                                      [s + delta for s in source_starts[last:]])
+        output_starts[first:] = array("q", [output_from + o for _, o in offsets] +
+                                      [o + output_delta for o in output_starts[last:]])
+        return output_from, output_to, converted
+
+    def insert(self, position, text):
+        return self.edit(position, position, text)
+
+    def delete(self, start, end):
+        return self.edit(start, end, "")
+
+    def span(self, starts, other_starts, other_length, start, end):
+        if not len(starts):
+            return 0, 0
+        first = max(bisect_right(starts, start) - 1, 0)
+        last = bisect_left(starts, end)
+        return other_starts[first], other_starts[last] if last < len(other_starts) else other_length
+
+    def output_span(self, start, end=None):
+        """The output span converted from the pieces holding source[start:end]."""
+        end = start + 1 if end is None else max(end, start + 1)
+        return self.span(self.source_starts, self.output_starts, len(self.output), start, end)
+
+    def source_span(self, start, end=None):
+        """The source span of the pieces that output[start:end] came from."""
+        end = start + 1 if end is None else max(end, start + 1)
+        return self.span(self.output_starts, self.source_starts, len(self.source), start, end)
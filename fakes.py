@@ -0,0 +1,184 @@
+"""Stand-ins for the keyboard controller and clipboard, so the mapper can run without a display."""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class FakeKey:
+    """A special key, compared by name like pynput.keyboard.Key members."""
+
+    def __init__(self, name):
+        self.name = name
+        self.char = None
+
+    def __eq__(self, other):
+        return getattr(other, "name", None) == self.name and getattr(other, "char", None) is None
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f"Key.{self.name}"
+
+
+class FakeKeyCode:
+    """A character key, like pynput.keyboard.KeyCode."""
+
+    def __init__(self, char):
+        self.char = char
+        self.name = None
+
+    def __eq__(self, other):
+        return getattr(other, "char", None) == self.char
+
+    def __hash__(self):
+        return hash(self.char)
+
+    def __repr__(self):
+        return repr(self.char)
+
+
+class FakeKeys:
+    """Namespace of special keys standing in for pynput.keyboard.Key."""
+
+    backspace = FakeKey("backspace")
+    ctrl = FakeKey("ctrl")
+    shift = FakeKey("shift")
+    left = FakeKey("left")
+    space = FakeKey("space")
+    enter = FakeKey("enter")
+    tab = FakeKey("tab")
+    f9 = FakeKey("f9")
+    f12 = FakeKey("f12")
+
+    @staticmethod
+    def from_name(name):
+        """A special key by name, or a character key for a single character."""
+        if len(name) == 1:
+            return FakeKeyCode(name)
+        key = getattr(FakeKeys, name, None)
+        return key if isinstance(key, FakeKey) else FakeKey(name)
+
+
+class FakeClipboard:
+    """Same interface as pyperclip: copy(text) and paste()."""
+
+    def __init__(self, text="", delay=0.0):
+        self.text = text
+        self.delay = delay
+        self.copies = 0
+        self.pastes = 0
+
+    def copy(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.copies += 1
+        self.text = text
+
+    def paste(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self.pastes += 1
+        return self.text
+
+
+class FakeController:
+    """A keyboard controller that edits an in-memory text field.
+
+    Supports typing, backspace, Shift+Left selection and Ctrl+V from `clipboard`.
+    `echo(key, injected)` is called for every press, the way a key event
+    comes through the keyboard listener: from a listener thread of its own,
+    in the order the field took the presses. Presses are injected unless
+    made with injected=False, as the replayed user's are. With double_echo an
+    injected special key is also echoed flagged on the pressing thread as it
+    is pressed, and its listener copy comes unflagged, as pynput on Xorg
+    reports them. `delay` is slept per event to mimic a slow application.
+    """
+
+    def __init__(self, clipboard=None, echo=None, delay=0.0, double_echo=False):
+        self.clipboard = clipboard
+        self.echo = echo
+        self.delay = delay
+        self.double_echo = double_echo
+        self.text = ""
+        self.selection = 0
+        self.held = set()
+        self.events = 0
+        self.lock = threading.Lock()
+        self.echoes = queue.Queue()
+        threading.Thread(target=self.deliver, daemon=True).start()
+
+    def deliver(self):
+        while True:
+            key, injected = self.echoes.get()
+            if self.echo:
+                self.echo(key, injected)
+            self.echoes.task_done()
+
+    def drain(self):
+        """Wait until every press so far has been echoed."""
+        self.echoes.join()
+
+    def _key(self, key):
+        return FakeKeyCode(key) if isinstance(key, str) else key
+
+    def insert(self, text):
+        if self.selection:
+            self.text = self.text[:-self.selection]
+            self.selection = 0
+        self.text += text
+
+    def press(self, key, injected=True):
+        key = self._key(key)
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.events += 1
+            if key in (FakeKeys.ctrl, FakeKeys.shift):
+                self.held.add(key.name)
+            elif key == FakeKeys.backspace:
+                if self.selection:
+                    self.insert("")
+                else:
+                    self.text = self.text[:-1]
+            elif key == FakeKeys.left:
+                if "shift" in self.held:
+                    self.selection = min(self.selection + 1, len(self.text))
+            elif "ctrl" in self.held:
+                # A shortcut; only Ctrl+V does anything here
+                if key.char == "v" and self.clipboard is not None:
+                    self.insert(self.clipboard.text)
+            elif key == FakeKeys.space:
+                self.insert(" ")
+            elif key == FakeKeys.enter:
+                self.insert("\n")
+            elif key == FakeKeys.tab:
+                self.insert("\t")
+            elif key.char is not None:
+                self.insert(key.char)
+            doubled = injected and self.double_echo and isinstance(key, FakeKey)
+            if doubled and self.echo:
+                self.echo(key, True)
+            self.echoes.put((key, injected and not doubled))
+
+    def release(self, key):
+        key = self._key(key)
+        with self.lock:
+            if key in (FakeKeys.ctrl, FakeKeys.shift):
+                self.held.discard(key.name)
+
+    @contextmanager
+    def pressed(self, *keys):
+        for key in keys:
+            self.press(key)
+        try:
+            yield
+        finally:
+            for key in reversed(keys):
+                self.release(key)
+
+    def type(self, text):
+        for char in text:
+            self.press(char)
+            self.release(char)
@@ -0,0 +1,158 @@
+"""Differential fuzzer: generated input through the reference and the fast engine, which must agree.
+
+    python fuzz.py                                  # 20000 cases of each kind, seed 0
+    python fuzz.py --cases 200000 --seed 7 --max-length 40
+    python fuzz.py --replay shadow-mismatches.jsonl # inputs logged by shadow mode
+
+Bijoy text is built from whole words, every glyph of the conversion maps and,
+more often than the rest, the glyphs the rearrangement moves or joins (kars,
+refs, halants) and the sequences preConversion rewrites. Keystrokes are drawn
+from the layout's keys. Every mismatch is shrunk to a shortest input that
+still differs before it is printed; the exit status is 1 if there were any.
+"""
+import argparse
+import json
+import random
+import sys
+
+import converter
+import util
+from benchmark import PUNCTUATION, WORDS
+from interpreter import LAYOUT_PATH, BijoyConverter
+
+
+def tricky_glyphs():
+    """Bijoy glyphs the rearrangement moves or joins, and the sequences preConversion rewrites."""
+    glyphs = []
+    for charMap in (converter.specialJuktoConversionMap, converter.conversionMap):
+        for srcKey, keyVal in charMap.items():
+            if keyVal in ("ি", "ে", "ৈ", "র্") or keyVal.startswith("্") or keyVal.endswith("্"):
+                glyphs.append(util.literalPattern(srcKey))
+    glyphs.extend(literal for literal in map(util.literalPattern, converter.preConversionMap) if literal)
+    return glyphs
+
+
+class Generator:
+    def __init__(self, key_map, seed=0, max_length=30):
+        self.random = random.Random(seed)
+        self.max_length = max_length
+        self.glyphs = [util.literalPattern(srcKey) for charMap in (converter.specialJuktoConversionMap,
+                                                                   converter.conversionMap)
+                       for srcKey in charMap]
+        self.tricky = tricky_glyphs()
+        self.keys = list(key_map)
+
+    def bijoy(self):
+        rnd = self.random
+        length = rnd.randint(0, self.max_length)
+        parts = []
+        while sum(map(len, parts)) < length:
+            roll = rnd.random()
+            if roll < 0.1:
+                parts.append(rnd.choice(WORDS) + rnd.choice(PUNCTUATION))
+            elif roll < 0.5:
+                parts.append(rnd.choice(self.tricky))
+            elif roll < 0.9:
+                parts.append(rnd.choice(self.glyphs))
+            else:
+                parts.append(rnd.choice(" \n"))
+        return "".join(parts)
+
+    def keystrokes(self):
+        rnd = self.random
+        length = rnd.randint(0, self.max_length)
+        parts = []
+        while sum(map(len, parts)) < length:
+            parts.append(rnd.choice(self.keys) if rnd.random() < 0.9 else " ")
+        return "".join(parts)
+
+
+class Differ:
+    """Runs an op through both engines and tells whether their results differ."""
+
+    def __init__(self, layout_path=LAYOUT_PATH):
+        self.converter = BijoyConverter(layout_path, engine="reference", shadow=0)
+        self.reference = self.converter.engine
+        self.fast = BijoyConverter(layout_path, engine="fast", shadow=0).engine
+
+    def results(self, op, text):
+        results = []
+        for engine in (self.reference, self.fast):
+            try:
+                results.append(getattr(engine, op)(text))
+            except Exception as e:
+                results.append(f"<{type(e).__name__}: {e}>")
+        return results
+
+    def differs(self, op, text):
+        reference, fast = self.results(op, text)
+        return reference != fast
+
+    def shrink(self, op, text):
+        """A shorter input, found by dropping one character at a time, on which the engines still differ."""
+        shrunk = True
+        while shrunk:
+            shrunk = False
+            for i in range(len(text)):
+                candidate = text[:i] + text[i + 1:]
+                if self.differs(op, candidate):
+                    text = candidate
+                    shrunk = True
+                    break
+        return text
+
+    def report(self, op, text):
+        text = self.shrink(op, text)
+        reference, fast = self.results(op, text)
+        print(f"{op} {text!r}\n  reference {reference!r}\n  fast      {fast!r}")
+
+
+def fuzz(differ, cases, seed=0, max_length=30):
+    """Number of mismatches over cases inputs of each kind."""
+    generator = Generator(differ.converter.key_map, seed, max_length)
+    mismatches = 0
+    for _ in range(cases):
+        checks = [("convert_bijoy", generator.bijoy())]
+        keys = generator.keystrokes()
+        checks += [("map_keys", keys), ("convert", keys)]
+        for op, text in checks:
+            if differ.differs(op, text):
+                mismatches += 1
+                differ.report(op, text)
+    return mismatches
+
+
+def replay(differ, path):
+    """Number of logged inputs on which the engines still differ."""
+    mismatches = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if differ.differs(entry["op"], entry["input"]):
+                mismatches += 1
+                differ.report(entry["op"], entry["input"])
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the reference and the fast conversion engine")
+    parser.add_argument("--cases", type=int, default=20000, help="inputs of each kind (default: 20000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-length", type=int, default=30, help="longest input in characters (default: 30)")
+    parser.add_argument("--layout", default=LAYOUT_PATH, help="layout JSON file")
+    parser.add_argument("--replay", metavar="LOG", help="check the inputs of a shadow mismatch log instead")
+    args = parser.parse_args(argv)
+
+    differ = Differ(args.layout)
+    if args.replay:
+        mismatches = replay(differ, args.replay)
+    else:
+        mismatches = fuzz(differ, args.cases, args.seed, args.max_length)
+    print(f"{mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Check import-time budgets for the entry points.
+
+    python importtime.py                  # every module in BUDGETS_MS and HEADLESS
+    python importtime.py stream main      # only these
+    python importtime.py --scale 2        # double every budget on a slow machine
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+and the best cumulative time of a few runs is compared against its budget.
+Headless modules also fail if they pull in the keyboard/mouse stack; those
+without a budget are timed but only checked for that.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Cumulative import time per module in milliseconds
+BUDGETS_MS = {
+    "main": 20,
+    "interpreter": 25,
+    "converter": 40,
+    "stream": 60,
+    "parallel": 90,
+}
+
+# Modules that must never load the interactive dependencies
+HEADLESS = ("main", "interpreter", "converter", "stream", "parallel", "clipboard", "metrics", "replay", "layouts",
+            "server", "client", "transducer", "detect")
+INTERACTIVE_MODULES = ("pynput", "pyperclip", "listener")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module):
+    """Return (cumulative import time in ms, names of every module it loaded)."""
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=HERE, capture_output=True, text=True, check=True)
+    cumulative = None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1]) / 1000
+    return cumulative, set(result.stdout.split())
+
+
+def check(modules, scale=1.0, runs=5):
+    failures = []
+    for module in modules:
+        samples = [measure(module) for _ in range(runs)]
+        best = min(ms for ms, _ in samples)
+        budget = BUDGETS_MS.get(module, float("inf")) * scale
+        loaded = samples[0][1]
+        print(f"{module:12} {best:7.1f} ms  " + (f"(budget {budget:.0f} ms)" if module in BUDGETS_MS else "(no budget)"))
+        if best > budget:
+            failures.append(f"{module} took {best:.1f} ms, over its {budget:.0f} ms budget")
+        if module in HEADLESS:
+            interactive = sorted(name for name in loaded if name.split(".")[0] in INTERACTIVE_MODULES)
+            if interactive:
+                failures.append(f"{module} loads the interactive stack: {', '.join(interactive)}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import-time budgets")
+    parser.add_argument("modules", nargs="*",
+                        default=list(BUDGETS_MS) + [module for module in HEADLESS if module not in BUDGETS_MS])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget")
+    parser.add_argument("--runs", type=int, default=5, help="runs per module; the best one counts")
+    args = parser.parse_args(argv)
+
+    failures = check(args.modules, args.scale, args.runs)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import NULL_METRICS
+
+
+class CompletionTracker:
+    """Counts injected key events as the keyboard listener sees them come back.
+
+    An event that has reached the listener has been through the display server,
+    so waiting for the echo replaces guessing with fixed sleeps. Until the first
+    echo arrives the backend is assumed not to report injected events, and
+    waits return at once.
+
+    The injected flag alone does not prove an echo: pynput on Xorg reports
+    some keys as injected the moment they are sent, on the sending thread,
+    and the server's copy comes later unflagged. So every key is noted by
+    sent() before it is pressed and a flagged event on a sending thread is
+    ignored. Keys reported that way are doubled: an unflagged event is taken
+    as the echo of a doubled key sent within grace seconds. Other unflagged
+    events are always the user's, though a user's doubled key pressed while
+    one of ours is on its way can be taken for ours.
+
+    Events a wait gave up on are written off: echoes arrive in order, so the
+    next ones to come back are theirs and are ignored rather than credited to
+    later events. One that has not come back within grace seconds is taken
+    as lost.
+    """
+
+    def __init__(self, grace=1.0):
+        self.condition = threading.Condition()
+        self.grace = grace
+        self.outstanding = 0
+        # [count, deadline] for each batch of written-off events, oldest first
+        self.written_off = deque()
+        # (key, deadline) for each key sent and not echoed yet, and the threads that sent them
+        self.sent_keys = deque()
+        self.senders = set()
+        self.doubled = set()
+        self.active = False
+        # Every echo so far; a user key tagged with it tells which injected keys went before it
+        self.echoes = 0
+
+    def expect(self, count=1):
+        with self.condition:
+            self.outstanding += count
+
+    def sent(self, key):
+        """Note a key about to be pressed, so its echo can be told from the user's keys."""
+        with self.condition:
+            self.senders.add(threading.get_ident())
+            self.sent_keys.append((key, time.monotonic() + self.grace))
+
+    def echo(self, key, injected=False):
+        """Take a key event from the listener; True if it is one of the sent keys coming back."""
+        with self.condition:
+            if injected and threading.get_ident() in self.senders:
+                # Reported by the controller as it sent the key; it has not been anywhere
+                self.doubled.add(key)
+                return True
+            now = time.monotonic()
+            while self.sent_keys and self.sent_keys[0][1] < now:
+                self.sent_keys.popleft()
+            found = next((i for i, (sent, _) in enumerate(self.sent_keys) if same_key(sent, key)), None)
+            if not injected and (found is None or key not in self.doubled):
+                return False
+            if found is not None:
+                del self.sent_keys[found]
+            elif self.sent_keys:
+                # Flagged by the backend, so ours, though it reports the key differently
+                self.sent_keys.popleft()
+            self.observe()
+            return True
+
+    def observe(self):
+        with self.condition:
+            self.active = True
+            self.echoes += 1
+            now = time.monotonic()
+            while self.written_off and self.written_off[0][1] < now:
+                self.written_off.popleft()
+            if self.written_off:
+                # The late echo of an event already given up on
+                batch = self.written_off[0]
+                batch[0] -= 1
+                if not batch[0]:
+                    self.written_off.popleft()
+                return
+            # An echo can beat the expect() that follows its key, so this may go below zero
+            self.outstanding -= 1
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        """Block until every expected event has echoed back; False if timeout ran out first."""
+        with self.condition:
+            if self.active and self.condition.wait_for(lambda: self.outstanding <= 0, timeout):
+                return True
+            if self.outstanding <= 0:
+                return True
+            self.written_off.append([self.outstanding, time.monotonic() + self.grace])
+            self.outstanding = 0
+            return not self.active
+
+
+def same_key(sent, key):
+    """True if key, as the listener reports it, is sent (a key, or a character typed as text)."""
+    if isinstance(sent, str):
+        # pynput's special keys (space, enter, tab) hold their KeyCode, and so their character, in value
+        return sent in (getattr(key, "char", None), getattr(getattr(key, "value", None), "char", None))
+    return key == sent
+
+
+class Injector:
+    """Replaces the characters just typed with new text through a keyboard controller.
+
+    `keys` is the namespace holding backspace, ctrl, shift, left and space
+    (pynput.keyboard.Key for a real controller). When a tracker is given, each
+    step waits for its own key presses to echo back instead of sleeping; without
+    one, events are sent back to back. Stage latencies go to metrics, if given.
+    """
+
+    name = None
+
+    def __init__(self, controller, keys, tracker=None, timeout=0.25, debug=False, metrics=None):
+        self.controller = controller
+        self.keys = keys
+        self.tracker = tracker
+        self.timeout = timeout
+        self.debug = debug
+        self.metrics = metrics or NULL_METRICS
+
+    def press(self, key):
+        if self.tracker is not None:
+            self.tracker.sent(key)
+        self.controller.press(key)
+
+    def tap(self, key):
+        self.press(key)
+        self.controller.release(key)
+
+    @contextmanager
+    def pressed(self, key):
+        self.press(key)
+        try:
+            yield
+        finally:
+            self.controller.release(key)
+
+    def settle(self, count):
+        """Wait for the last count key presses to reach the listener."""
+        if self.tracker is None or not count:
+            return True
+        self.tracker.expect(count)
+        if self.tracker.wait(self.timeout):
+            return True
+        if self.debug:
+            print(f"Timed out waiting for {count} injected keys")
+        self.metrics.count("settle_timeouts")
+        return False
+
+    def delete(self, count):
+        with self.metrics.time("delete"):
+            for _ in range(count):
+                self.tap(self.keys.backspace)
+            self.settle(count)
+
+    def insert(self, text):
+        raise NotImplementedError
+
+    def landing(self, echoes, text, char):
+        """(index in text, what it put there) for char typed after echoes of insert(text)'s own presses."""
+        raise NotImplementedError
+
+    def replace(self, delete_count, text):
+        """Delete delete_count characters before the cursor and insert text; False on failure."""
+        self.delete(delete_count)
+        return self.insert(text)
+
+
+class TypeInjector(Injector):
+    """Types the Unicode text directly through the controller; no clipboard involved."""
+
+    name = "type"
+
+    def insert(self, text):
+        with self.metrics.time("type"):
+            if self.tracker is not None:
+                for char in text:
+                    self.tracker.sent(char)
+            self.controller.type(text)
+            self.settle(len(text))
+        return True
+
+    def landing(self, echoes, text, char):
+        return min(echoes, len(text)), char
+
+
+class PasteInjector(Injector):
+    """Backspaces the old text, then pastes the new text from the clipboard.
+
+    With preserve, the user's clipboard is backed up once per typing burst and
+    restored once, restore_delay after the last paste of the burst. With verify,
+    the clipboard is read back before pasting. Turning both off leaves a single
+    copy per word.
+    """
+
+    name = "paste"
+
+    # How long the user's clipboard stays replaced after the last paste
+    restore_delay = 1.0
+
+    def __init__(self, controller, keys, clipboard, tracker=None, timeout=0.25, debug=False,
+                 preserve=True, verify=True, metrics=None):
+        super().__init__(controller, keys, tracker, timeout, debug, metrics)
+        self.clipboard = clipboard
+        self.preserve = preserve
+        self.verify = verify
+        self.original_clipboard = None
+        self.restore_timer = None
+        self.lock = threading.Lock()
+
+    def backup_clipboard(self):
+        """Backup current clipboard content"""
+        try:
+            self.original_clipboard = self.clipboard.paste()
+            if self.debug:
+                print("Clipboard backed up")
+        except Exception as e:
+            if self.debug:
+                print(f"Failed to backup clipboard: {e}")
+            self.original_clipboard = ""
+
+    def restore_clipboard(self):
+        """Restore original clipboard content"""
+        with self.lock:
+            try:
+                if self.original_clipboard is not None:
+                    with self.metrics.time("restore"):
+                        self.clipboard.copy(self.original_clipboard)
+                    self.original_clipboard = None
+                    if self.debug:
+                        print("Clipboard restored")
+            except Exception as e:
+                if self.debug:
+                    print(f"Failed to restore clipboard: {e}")
+
+    def set_clipboard(self, text):
+        """Copy text and poll until the clipboard reports it, rather than sleeping a fixed time."""
+        with self.metrics.time("clipboard_set"):
+            self.clipboard.copy(text)
+            if not self.verify:
+                return True
+            deadline = time.monotonic() + self.timeout
+            while self.clipboard.paste() != text:
+                if time.monotonic() > deadline:
+                    if self.debug:
+                        print("Clipboard verification failed")
+                    self.metrics.count("clipboard_failures")
+                    return False
+                time.sleep(0.002)
+            return True
+
+    def paste(self):
+        with self.metrics.time("paste"):
+            with self.pressed(self.keys.ctrl):
+                self.tap("v")
+            self.settle(2)
+
+    def landing(self, echoes, text, char):
+        if not echoes:
+            return 0, char
+        if echoes == 1:
+            # With Ctrl down the key is a shortcut, and V one more paste
+            return 0, text if char == "v" else ""
+        # Ctrl is released right after V
+        return len(text), char
+
+    def insert(self, text):
+        try:
+            with self.lock:
+                # Only the first paste of a burst backs up; later ones find the restore still pending
+                if self.restore_timer is not None:
+                    self.restore_timer.cancel()
+                    self.restore_timer = None
+                if self.preserve and self.original_clipboard is None:
+                    self.backup_clipboard()
+                if not self.set_clipboard(text):
+                    return False
+                self.paste()
+            if self.preserve:
+                self.schedule_restore()
+            return True
+        except Exception as e:
+            if self.debug:
+                print(f"Paste failed: {e}")
+            self.restore_clipboard()
+            return False
+
+    def schedule_restore(self):
+        # The app reads the clipboard on its own time, so the restore stays deferred
+        with self.lock:
+            if self.restore_timer is not None:
+                self.restore_timer.cancel()
+            self.restore_timer = threading.Timer(self.restore_delay, self.restore_clipboard)
+            self.restore_timer.daemon = True
+            self.restore_timer.start()
+
+
+class SelectPasteInjector(PasteInjector):
+    """Selects the old text with Shift+Left and pastes over it, so the swap is one edit."""
+
+    name = "select-paste"
+
+    def delete(self, count):
+        with self.metrics.time("delete"):
+            with self.pressed(self.keys.shift):
+                for _ in range(count):
+                    self.tap(self.keys.left)
+            self.settle(count + 1)
+
+
+STRATEGIES = {injector.name: injector for injector in (TypeInjector, PasteInjector, SelectPasteInjector)}
+
+
+def create_injector(strategy, controller, keys, clipboard=None, tracker=None, timeout=0.25, debug=False,
+                    preserve_clipboard=True, verify_clipboard=True, metrics=None):
+    injector = STRATEGIES[strategy]
+    if issubclass(injector, PasteInjector):
+        return injector(controller, keys, clipboard, tracker, timeout, debug, preserve_clipboard, verify_clipboard,
+                        metrics)
+    return injector(controller, keys, tracker, timeout, debug, metrics)
+
+
+def measure_latency(injector, replacements):
+    """Time injector.replace for each (delete_count, text); returns the latencies in seconds."""
+    latencies = []
+    for delete_count, text in replacements:
+        start = time.perf_counter()
+        injector.replace(delete_count, text)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+if __name__ == "__main__":
+    # Replacement latency of every strategy against the fake text field
+    from fakes import FakeClipboard, FakeController, FakeKeys
+    from interpreter import get_default_converter
+
+    words = ["gS", "Yh", "kb", "jgNgb", "ngkz"] * 20
+    converter = get_default_converter()
+    expected = "".join(converter.convert(word) + " " for word in words)
+
+    runs = [(strategy, True, False) for strategy in STRATEGIES] + [("paste", False, False),
+                                                                  ("select-paste", False, False),
+                                                                  ("paste", True, True)]
+    for strategy, preserve, double_echo in runs:
+        tracker = CompletionTracker()
+        clipboard = FakeClipboard()
+        controller = FakeController(clipboard, echo=tracker.echo, double_echo=double_echo)
+        injector = create_injector(strategy, controller, FakeKeys, clipboard, tracker,
+                                   preserve_clipboard=preserve, verify_clipboard=preserve)
+        latencies = []
+        for word in words:
+            # The user's own typing goes straight into the field; only injected keys echo
+            controller.insert(word + " ")
+            latencies += measure_latency(injector, [(len(word) + 1, converter.convert(word) + " ")])
+        latencies.sort()
+        mean = sum(latencies) / len(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        result = "ok" if controller.text == expected else "WRONG TEXT"
+        controller.drain()
+        if tracker.sent_keys or tracker.echoes != controller.events:
+            result += ", ECHOES NOT MATCHED"
+        label = strategy + ("" if preserve else " (fast)") + (" (Xorg)" if double_echo else "")
+        print(f"{label:28} mean {mean * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms   {result}")
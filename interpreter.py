@@ -1,32 +1,272 @@
-import json
-from converter import Unicode
+import functools
+import os
+import threading
+import util
 
-# Load the JSON file
-with open("bijoyClassic_parsed.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
+LAYOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bijoyClassic_parsed.json")
+
+# Most recently used words kept per cache; None means unbounded, 0 disables caching
+WORD_CACHE_SIZE = 8192
+
+# "reference" runs the staged pipeline, "fast" the compiled tables in transducer.py.
+# The settings are read from the environment so that worker processes follow their parent.
+ENGINES = ("reference", "fast")
+ENGINE_VARIABLE = "BIJOY_ENGINE"
+SHADOW_VARIABLE = "BIJOY_SHADOW"  # fraction of inputs also run through the other engine
+SHADOW_LOG_VARIABLE = "BIJOY_SHADOW_LOG"
+
+
+class KeyTrie(dict):
+    """Prefix tree over a key map; the mapped value of a complete key sits under None."""
+
+
+def build_key_trie(key_mapping):
+    root = KeyTrie()
+    for key, value in key_mapping.items():
+        node = root
+        for char in key:
+            node = node.setdefault(char, {})
+        node[None] = value
+    return root
 
-key_map = data["map"]["general"]
 
 def map_input_string(input_string, key_mapping):
+    # Plain dicts still work, but callers on a hot path should pass a prebuilt trie
+    if not isinstance(key_mapping, KeyTrie):
+        key_mapping = build_key_trie(key_mapping)
+
     output = []
     i = 0
-    while i < len(input_string):
-        # Try 3-character lookahead
-        if i + 2 < len(input_string) and input_string[i:i+3] in key_mapping:
-            output.append(key_mapping[input_string[i:i+3]])
-            i += 3
-        elif i + 1 < len(input_string) and input_string[i:i+2] in key_mapping:
-            output.append(key_mapping[input_string[i:i+2]])
-            i += 2
-        elif input_string[i] in key_mapping:
-            output.append(key_mapping[input_string[i]])
-            i += 1
-        else:
+    length = len(input_string)
+    while i < length:
+        # Greedy longest match: walk the trie as far as the input allows
+        node = key_mapping
+        match = None
+        match_end = i
+        j = i
+        while j < length:
+            node = node.get(input_string[j])
+            if node is None:
+                break
+            j += 1
+            if None in node:
+                match = node[None]
+                match_end = j
+
+        if match is None:
             output.append(input_string[i])  # Fallback: use original character
             i += 1
+        else:
+            output.append(match)
+            i = match_end
     return ''.join(output)
 
 
-def interpreter(input_string): 
-    unicode = Unicode()
-    return unicode.convertBijoyToUnicode(map_input_string(input_string, key_map))
+def longest_match(key_trie, text, i):
+    """(mapped value, end) of the longest key at text[i:]; the character itself when no key matches."""
+    node = key_trie
+    match = text[i]
+    match_end = i + 1
+    j = i
+    while j < len(text):
+        node = node.get(text[j])
+        if node is None:
+            break
+        j += 1
+        if None in node:
+            match = node[None]
+            match_end = j
+    return match, match_end
+
+
+class IncrementalWord:
+    """The keystrokes of one word, mapped as they are typed.
+
+    A greedy match starting more than the longest key length before the end
+    cannot see the key that was added or removed, so those matches are kept and
+    only the ones after them are walked again.
+    """
+
+    def __init__(self, converter):
+        self.converter = converter
+        self.keys = ""
+        self.tokens = []  # (start, end, mapped value) of every match so far
+
+    def push(self, char):
+        self.update(self.keys + char)
+
+    def pop(self):
+        self.update(self.keys[:-1])
+
+    def clear(self):
+        self.keys = ""
+        self.tokens = []
+
+    def update(self, keys):
+        stable = min(len(keys), len(self.keys)) - self.converter.max_key_length
+        kept = 0
+        while kept < len(self.tokens) and self.tokens[kept][0] < stable:
+            kept += 1
+        del self.tokens[kept:]
+
+        i = self.tokens[-1][1] if self.tokens else 0
+        while i < len(keys):
+            value, end = longest_match(self.converter.key_trie, keys, i)
+            self.tokens.append((i, end, value))
+            i = end
+        self.keys = keys
+
+    def bijoy(self):
+        return "".join(value for _, _, value in self.tokens)
+
+    def unicode(self):
+        # Rearrangement moves kars and refs across the whole word, so that stage reruns on it
+        return self.converter.convert_bijoy_word(self.bijoy())
+
+
+def compile_layout(layout_path):
+    import json
+
+    # Load the JSON file
+    with open(layout_path, "r", encoding="utf-8") as f:
+        layout = json.load(f)
+    return layout, build_key_trie(layout["map"]["general"])
+
+
+def load_layout(layout_path=LAYOUT_PATH, rebuild=False):
+    """Return (layout, key_trie), reusing the compiled copy until the JSON file changes."""
+    name = "layout-" + os.path.splitext(os.path.basename(layout_path))[0]
+    return util.loadCached(name, util.fileFingerprint(layout_path), lambda: compile_layout(layout_path), rebuild)
+
+
+def default_engine():
+    engine = os.environ.get(ENGINE_VARIABLE) or "reference"
+    if engine not in ENGINES:
+        raise ValueError(f"{ENGINE_VARIABLE} must be one of {', '.join(ENGINES)}, not {engine!r}")
+    return engine
+
+
+def default_shadow_sample():
+    return float(os.environ.get(SHADOW_VARIABLE) or 0)
+
+
+class ReferenceEngine:
+    """The staged pipeline: the key trie, then each character map and the rearrangement in turn."""
+
+    def __init__(self, key_trie, unicode):
+        self.key_trie = key_trie
+        self.unicode = unicode
+
+    def map_keys(self, text):
+        return map_input_string(text, self.key_trie)
+
+    def convert_bijoy(self, text):
+        return self.unicode.convertBijoyToUnicode(text)
+
+    def convert(self, text):
+        return self.unicode.convertBijoyToUnicode(map_input_string(text, self.key_trie))
+
+
+class BijoyConverter:
+    """Owns a loaded layout and its compiled lookups; build once and share freely.
+
+    Nothing but the word caches changes after __init__, and those are
+    thread-safe, so one instance can serve any number of threads.
+
+    engine is one of ENGINES, by default the one named in BIJOY_ENGINE. With a
+    shadow sample above 0 that fraction of the inputs also runs through the
+    other engine, and differences are logged (see shadow.py).
+    """
+
+    def __init__(self, layout_path=LAYOUT_PATH, cache_size=WORD_CACHE_SIZE, rebuild=False, engine=None,
+                 shadow=None, shadow_log=None):
+        from converter import Unicode
+
+        self.layout, self.key_trie = load_layout(layout_path, rebuild)
+        self.key_map = self.layout["map"]["general"]
+        self.max_key_length = max(map(len, self.key_map), default=1)
+        self.unicode = Unicode()
+
+        self.engine_name = engine or default_engine()
+        self.engine = self.make_engine(self.engine_name, layout_path, rebuild)
+        shadow = default_shadow_sample() if shadow is None else shadow
+        if shadow > 0:
+            from shadow import ShadowEngine
+
+            other = "fast" if self.engine_name == "reference" else "reference"
+            engines = {self.engine_name: self.engine, other: self.make_engine(other, layout_path, rebuild)}
+            self.engine = ShadowEngine(engines, self.engine_name, shadow,
+                                       shadow_log or os.environ.get(SHADOW_LOG_VARIABLE) or None)
+
+        # Words repeat constantly in typing and in prose, so whole-word results are memoized
+        self.convert_word = functools.lru_cache(maxsize=cache_size)(self.convert)
+        self.convert_bijoy_word = functools.lru_cache(maxsize=cache_size)(self.convert_bijoy)
+        self.convert_unicode_word = functools.lru_cache(maxsize=cache_size)(self.convert_unicode)
+
+    def make_engine(self, name, layout_path, rebuild):
+        if name == "fast":
+            from transducer import Transducer
+            return Transducer(layout_path, rebuild)
+        if name == "reference":
+            return ReferenceEngine(self.key_trie, self.unicode)
+        raise ValueError(f"unknown engine {name!r}; expected one of {', '.join(ENGINES)}")
+
+    def map_keys(self, text):
+        """Bijoy keystrokes to Bijoy-encoded text."""
+        return self.engine.map_keys(text)
+
+    def convert_bijoy(self, text):
+        """Bijoy-encoded text to Unicode."""
+        return self.engine.convert_bijoy(text)
+
+    def convert(self, text):
+        """Bijoy keystrokes to Unicode."""
+        return self.engine.convert(text)
+
+    def convert_unicode(self, text):
+        """Unicode to Bijoy-encoded text."""
+        return self.unicode.convertUnicodeToBijoy(text)
+
+    def cache_info(self):
+        """Hits, misses, max size and current size of the keystroke, Bijoy and Unicode word caches."""
+        return {
+            "keys": self.convert_word.cache_info(),
+            "bijoy": self.convert_bijoy_word.cache_info(),
+            "unicode": self.convert_unicode_word.cache_info(),
+        }
+
+    def cache_clear(self):
+        self.convert_word.cache_clear()
+        self.convert_bijoy_word.cache_clear()
+        self.convert_unicode_word.cache_clear()
+
+
+_default_converter = None
+_default_converter_lock = threading.Lock()
+
+
+def get_default_converter():
+    """The shared converter for the bundled layout, loaded on first use."""
+    global _default_converter
+    if _default_converter is None:
+        with _default_converter_lock:
+            if _default_converter is None:
+                _default_converter = BijoyConverter()
+    return _default_converter
+
+
+def __getattr__(name):
+    # The old module-level names stay available without loading anything at import
+    if name == "default_converter":
+        return get_default_converter()
+    if name == "data":
+        return get_default_converter().layout
+    if name == "key_map":
+        return get_default_converter().key_map
+    if name == "key_trie":
+        return get_default_converter().key_trie
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def interpreter(input_string):
+    return get_default_converter().convert(input_string)
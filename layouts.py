@@ -0,0 +1,108 @@
+"""Several compiled layouts, one of them active, reloaded when their files change.
+
+Each layout is a BijoyConverter of its own. The mapper reads registry.current
+once per key, so switching or reloading replaces one reference and no key is
+ever mapped by half of one layout and half of another. Reloads compile in the
+watcher thread; the old layout keeps serving until the new one is ready.
+"""
+import os
+import threading
+
+import util
+from interpreter import LAYOUT_PATH, BijoyConverter, get_default_converter
+
+
+def layout_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class LayoutRegistry:
+    """Named layouts in the order they were added, with one of them current."""
+
+    def __init__(self, paths=(), debug=False):
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.converters = {}
+        self.fingerprints = {}
+        self.names = []
+        self.current = None
+        self.current_name = None
+        self.debug = debug
+        for path in paths:
+            self.add(path)
+
+    def compile(self, path):
+        if os.path.abspath(path) == LAYOUT_PATH:
+            # The bundled layout is usually loaded already; share its word caches
+            return get_default_converter()
+        return BijoyConverter(path)
+
+    def add(self, path, name=None):
+        """Compile the layout at path and register it; the first one added becomes current."""
+        name = name or layout_name(path)
+        # Taken before compiling, so a save during the compile is picked up by the next check
+        fingerprint = util.fileFingerprint(path)
+        converter = self.compile(path)
+        with self.lock:
+            if name not in self.converters:
+                self.names.append(name)
+            self.paths[name] = path
+            self.converters[name] = converter
+            self.fingerprints[name] = fingerprint
+            if self.current is None or self.current_name == name:
+                self.current = converter
+                self.current_name = name
+        return converter
+
+    def switch(self, name):
+        with self.lock:
+            self.current = self.converters[name]
+            self.current_name = name
+        return self.current
+
+    def cycle(self):
+        """Make the next layout current, wrapping around; returns its name."""
+        with self.lock:
+            name = self.names[(self.names.index(self.current_name) + 1) % len(self.names)]
+            self.current = self.converters[name]
+            self.current_name = name
+        return name
+
+    def check(self):
+        """Recompile every layout whose file changed since it was compiled; returns their names."""
+        reloaded = []
+        for name in list(self.names):
+            path = self.paths[name]
+            try:
+                fingerprint = util.fileFingerprint(path)
+            except OSError:
+                continue  # Being replaced by an editor; look again next time
+            if fingerprint == self.fingerprints[name]:
+                continue
+            try:
+                converter = BijoyConverter(path)
+            except Exception as e:
+                # Keep serving the old layout; a half-saved file gets another try once it changes again
+                print(f"Failed to reload layout {name}: {e}")
+                self.fingerprints[name] = fingerprint
+                continue
+            with self.lock:
+                self.converters[name] = converter
+                self.fingerprints[name] = fingerprint
+                if self.current_name == name:
+                    self.current = converter
+            reloaded.append(name)
+            if self.debug:
+                print(f"Reloaded layout {name} from {path}")
+        return reloaded
+
+    def watch(self, interval=1.0):
+        """Check the layout files every interval seconds from a daemon thread; set the returned event to stop."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.check()
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop
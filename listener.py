@@ -1,26 +1,95 @@
-from interpreter import interpreter
-from pynput import keyboard, mouse
-import time
+from collections import deque
+from interpreter import LAYOUT_PATH, IncrementalWord
+from layouts import LayoutRegistry
+from injection import CompletionTracker, create_injector
+from clipboard import create_clipboard
+from metrics import NULL_METRICS
+import queue
+import router
 import threading
-import pyperclip
-from pynput.keyboard import Key, Controller
+import time
+
+# Worker states
+INACTIVE = "inactive"
+TYPING = "typing"
+REPLACING = "replacing"
+
+# Keys that type nothing by themselves; the character they shift arrives as its own key
+MODIFIERS = ("shift", "shift_l", "shift_r", "ctrl", "ctrl_l", "ctrl_r", "alt", "alt_l", "alt_r", "alt_gr",
+             "cmd", "cmd_l", "cmd_r", "caps_lock")
 
 
 class BijoyMapper:
-    def __init__(self):
+    """Converts Bijoy keystrokes to Unicode as they are typed.
+
+    By default it drives pynput: a real keyboard controller, pynput's Key
+    namespace and live keyboard/mouse listeners. Passing a controller and keys
+    (e.g. fakes.FakeController and fakes.FakeKeys) with listen=False runs it
+    without a display; events are then fed to on_key_press/on_mouse_click.
+
+    layouts is a LayoutRegistry; by default it holds the bundled layout alone.
+    With more than one layout, layout_key switches to the next. Words in
+    english, and URLs or e-mail addresses, are left as typed.
+    """
+
+    def __init__(self, strategy="paste", clipboard="pyperclip", preserve_clipboard=True, incremental=False,
+                 debug=False, metrics=None, controller=None, keys=None, listen=True, recorder=None, layouts=None,
+                 layout_key="f9", english=None):
         # Initialize keyboard controller
-        self.keyboard_controller = Controller()
+        if controller is None:
+            from pynput.keyboard import Controller, Key
+            controller, keys = Controller(), Key
+        self.keyboard_controller = controller
+        self.keys = keys
+        self.modifiers = {getattr(keys, name) for name in MODIFIERS if hasattr(keys, name)}
+        self.layouts = layouts or LayoutRegistry([LAYOUT_PATH])
+        self.layout_key = getattr(keys, layout_key)
+        self.converter = self.layouts.current
         self.is_active = False
-        self.is_processing = False
+        self.state = INACTIVE
 
-        # Current word being typed
+        # Current word being typed; only the worker thread touches it
         self.current_word = ""
 
+        # Incremental mode re-renders the word on every key; shown is what the
+        # screen holds for it right now, Bengali so far plus raw keys since
+        self.incremental = incremental
+        self.word = IncrementalWord(self.converter)
+        self.shown = ""
+
+        # Listener callbacks only queue events; one worker handles them in order.
+        # Events pulled ahead of time while replacing a word wait in the backlog.
+        self.events = queue.Queue()
+        self.backlog = deque()
+        self.worker = threading.Thread(target=self.process_events, daemon=True)
+
         # Debug mode
-        self.debug = True
+        self.debug = debug
+
+        # Stage latencies and counters; NULL_METRICS records nothing
+        self.metrics = metrics or NULL_METRICS
+
+        # Optional SessionRecorder that logs every key and click the user makes
+        self.recorder = recorder
 
-        # Store original clipboard content to restore later
-        self.original_clipboard = ""
+        # Lowercase words that are typed in English and never converted
+        self.english = english or frozenset()
+
+        # Replacement text goes out through the chosen strategy, paced by the
+        # echo of our own injected keys rather than fixed sleeps
+        self.tracker = CompletionTracker()
+        if isinstance(clipboard, str):
+            clipboard = create_clipboard(clipboard, self.debug) if strategy != "type" else None
+        self.clipboard = clipboard
+        self.injector = create_injector(strategy, self.keyboard_controller, self.keys, self.clipboard, self.tracker,
+                                        debug=self.debug, preserve_clipboard=preserve_clipboard,
+                                        verify_clipboard=preserve_clipboard, metrics=self.metrics)
+
+        self.worker.start()
+        if not listen:
+            return
+
+        from pynput import keyboard, mouse
 
         # Start keyboard listener
         self.keyboard_listener = keyboard.Listener(on_press=self.on_key_press)
@@ -32,11 +101,18 @@ class BijoyMapper:
 
         print("Bijoy Keyboard Mapper is running!")
         print("Press F12 to toggle on/off")
-        print("Debug mode is enabled. Check console for details.")
+        if len(self.layouts.names) > 1:
+            print(f"Press {layout_key.upper()} to switch layout (now {self.layouts.current_name})")
+        if self.debug:
+            print("Debug mode is enabled. Check console for details.")
 
     def is_ascii_only(self, text):
         return all(ord(char) < 128 for char in text)
 
+    def passes_through(self, keys):
+        """True for a word that stays as typed: a link, or a word in the English list."""
+        return router.is_link(keys) or keys.lower() in self.english
+
     def process_mapping(self, original, mapped):
         if self.debug:
             print(f"Processing mapping: '{original}' -> '{mapped}'")
@@ -63,141 +139,341 @@ class BijoyMapper:
             print(f"Common prefix length: {i}, returning: '{result}'")
         return result
 
-    def on_key_press(self, key):
-        try:
-            if self.is_processing:
-                if self.debug:
-                    print("Ignoring keystroke - currently processing")
-                return
-
-            if self.debug and hasattr(key, "char") and key.char:
-                print(f"Key pressed: '{key.char}'")
-
-            if key == keyboard.Key.f12:
-                self.is_active = not self.is_active
-                print(f"Bijoy Mapper {'activated' if self.is_active else 'deactivated'}")
-                return
+    def on_key_press(self, key, injected=False):
+        if self.tracker.echo(key, injected):
+            # Our own replacement coming back; the injector may be waiting on it
+            return
+        if self.recorder:
+            self.recorder.key(key)
+        self.events.put(("key", key, time.perf_counter(), self.tracker.echoes))
 
-            if not self.is_active:
+    def on_mouse_click(self, x, y, button, pressed):
+        if pressed:
+            if self.recorder:
+                self.recorder.click()
+            self.events.put(("click", None, time.perf_counter(), self.tracker.echoes))
+
+    def next_event(self):
+        if self.backlog:
+            return self.backlog.popleft()
+        return self.events.get()
+
+    def process_events(self):
+        while True:
+            event = self.next_event()
+            if event is None:
                 return
-
-            if hasattr(key, "char") and key.char:
-                if ord(key.char) < 128:  # ASCII only
-                    self.current_word += key.char
-                    if self.debug:
-                        print(f"Current word buffer: '{self.current_word}'")
+            kind, key, received, _ = event
+            if self.metrics:
+                self.metrics.record("queue", time.perf_counter() - received)
+            try:
+                if kind == "click":
+                    self.reset_word()
                 else:
-                    if self.debug:
-                        print(f"Ignoring non-ASCII character: '{key.char}'")
+                    self.metrics.count("keys")
+                    with self.metrics.time("key"):
+                        self.handle_key(key)
+                    if self.metrics and key == self.keys.space:
+                        # From the space reaching the listener to the converted word on screen
+                        self.metrics.record("word", time.perf_counter() - received)
+            except Exception as e:
+                print(f"Error in key handler: {e}")
+                self.metrics.count("errors")
+                self.reset_word()
+            # Every event was taken off the queue once, directly or into the backlog,
+            # so events.join() returns when all queued events have been handled
+            self.events.task_done()
+
+    def use_layout(self, converter):
+        """Map the word in progress with converter from now on."""
+        self.converter = converter
+        keys = self.word.keys
+        self.word = IncrementalWord(converter)
+        self.word.update(keys)
+
+    def reset_word(self):
+        self.current_word = ""
+        self.word.clear()
+        self.shown = ""
+
+    def handle_key(self, key):
+        if self.debug and hasattr(key, "char") and key.char:
+            print(f"Key pressed: '{key.char}'")
+
+        # A switch or a reload swaps the registry's converter; pick it up between keys
+        if self.layouts.current is not self.converter:
+            self.use_layout(self.layouts.current)
+
+        if key == self.layout_key and len(self.layouts.names) > 1:
+            name = self.layouts.cycle()
+            self.use_layout(self.layouts.current)
+            print(f"Layout: {name}")
+            if self.incremental and self.word.keys:
+                self.render_word()
+            return
 
-            elif key == keyboard.Key.space:
-                if self.current_word:
-                    if self.debug:
-                        print(f"Space pressed. Processing word: '{self.current_word}'")
-                    # Use threading to prevent blocking
-                    threading.Thread(target=self.process_current_word_reliable, daemon=True).start()
-                else:
-                    if self.debug:
-                        print("Space pressed but no word to process.")
-                self.current_word = ""
+        if key == self.keys.f12:
+            if self.is_active and self.incremental and self.word.keys:
+                # Keys queued behind the word may have held back its last edit
+                self.render_word(final=True)
+                self.reset_word()
+            self.is_active = not self.is_active
+            self.state = TYPING if self.is_active else INACTIVE
+            print(f"Bijoy Mapper {'activated' if self.is_active else 'deactivated'}")
+            return
 
-            elif key == keyboard.Key.backspace:
-                if self.current_word:
-                    self.current_word = self.current_word[:-1]
-                    if self.debug:
-                        print(f"Backspace pressed. Current word buffer: '{self.current_word}'")
+        if not self.is_active:
+            return
 
-            elif key in [keyboard.Key.enter, keyboard.Key.tab]:
+        if hasattr(key, "char") and key.char:
+            if ord(key.char) < 128:  # ASCII only
+                self.current_word += key.char
                 if self.debug:
-                    print(f"Enter/Tab pressed. Clearing word buffer: '{self.current_word}'")
-                self.current_word = ""
-
-        except Exception as e:
-            print(f"Error in key handler: {e}")
-            self.current_word = ""
-
-    def on_mouse_click(self, x, y, button, pressed):
-        if pressed:
-            self.current_word = ""
-
-    def backup_clipboard(self):
-        """Backup current clipboard content"""
-        try:
-            self.original_clipboard = pyperclip.paste()
-            if self.debug:
-                print("Clipboard backed up")
-        except Exception as e:
-            if self.debug:
-                print(f"Failed to backup clipboard: {e}")
-            self.original_clipboard = ""
+                    print(f"Current word buffer: '{self.current_word}'")
+                if self.incremental:
+                    with self.metrics.time("map"):
+                        self.word.push(key.char)
+                    self.shown += key.char
+                    self.render_word()
+            else:
+                if self.debug:
+                    print(f"Ignoring non-ASCII character: '{key.char}'")
+                self.metrics.count("dropped_keys")
 
-    def restore_clipboard(self):
-        """Restore original clipboard content"""
-        try:
-            if self.original_clipboard is not None:
-                pyperclip.copy(self.original_clipboard)
+        elif key == self.keys.space:
+            if self.current_word:
                 if self.debug:
-                    print("Clipboard restored")
-        except Exception as e:
-            if self.debug:
-                print(f"Failed to restore clipboard: {e}")
+                    print(f"Space pressed. Processing word: '{self.current_word}'")
+                if self.incremental:
+                    # Already on screen unless keys were queued behind the last one
+                    self.metrics.count("words")
+                    self.render_word(" ")
+                    self.reset_word()
+                    return
+                if self.passes_through(self.current_word):
+                    # Nothing to replace, so no keys, clipboard or paste at all
+                    if self.debug:
+                        print(f"Leaving '{self.current_word}' as typed")
+                    self.metrics.count("words")
+                    self.metrics.count("passthrough_words")
+                    self.current_word = ""
+                    return
+                word = self.current_word
+                self.current_word = ""
+                self.state = REPLACING
+                try:
+                    self.process_current_word_reliable(word)
+                finally:
+                    self.state = TYPING
+            else:
+                if self.debug:
+                    print("Space pressed but no word to process.")
 
-    def type_with_pyperclip(self, text):
-        """Type text using pyperclip and Ctrl+V"""
-        try:
+        elif key == self.keys.backspace:
+            if self.current_word:
+                self.current_word = self.current_word[:-1]
+                if self.debug:
+                    print(f"Backspace pressed. Current word buffer: '{self.current_word}'")
+                if self.incremental:
+                    # The app has already removed the last character shown
+                    with self.metrics.time("map"):
+                        self.word.pop()
+                    self.shown = self.shown[:-1]
+                    self.render_word()
+
+        elif key in [self.keys.enter, self.keys.tab]:
             if self.debug:
-                print(f"Typing with pyperclip: '{text}'")
-
-            # Backup current clipboard
-            self.backup_clipboard()
-
-            # Set text to clipboard
-            pyperclip.copy(text)
-            
-            # Small delay to ensure clipboard is set
-            time.sleep(0.05)
+                print(f"Enter/Tab pressed. Clearing word buffer: '{self.current_word}'")
+            if self.incremental and self.word.keys:
+                self.render_word("\n" if key == self.keys.enter else "\t")
+            self.reset_word()
+
+    def typed_ahead(self):
+        """Text already typed after the word's space, or None if it can't be known.
+
+        Those keys reached the screen before the replacement, so they are pulled
+        into the backlog (to be handled next, in order) and retyped after it.
+        """
+        self.pull_events()
+        separators = {self.keys.space: " ", self.keys.enter: "\n", self.keys.tab: "\t"}
+        tail = ""
+        for event in self.backlog:
+            if event is None:
+                break  # stop() was called; nothing comes after it
+            if event[0] != "key":
+                return None
+            key = event[1]
+            if key in self.modifiers:
+                continue
+            if hasattr(key, "char") and key.char and ord(key.char) < 128:
+                tail += key.char
+            elif key in separators:
+                tail += separators[key]
+            elif key == self.keys.backspace and tail:
+                tail = tail[:-1]
+            else:
+                return None
+        return tail
+
+    def pull_events(self):
+        """Move every queued event into the backlog."""
+        while True:
+            try:
+                self.backlog.append(self.events.get_nowait())
+            except queue.Empty:
+                break
 
-            # Verify clipboard content
-            clipboard_content = pyperclip.paste()
-            if clipboard_content != text:
+    def events_pending(self):
+        """True if events wait to be handled; stop()'s None is not one."""
+        self.pull_events()
+        return any(event is not None for event in self.backlog)
+
+    def typed_since(self, handled):
+        """(echoes, character) for each key typed after the first handled events of the backlog.
+
+        None if one of them types no text, which cannot be put right after the
+        fact.
+        """
+        self.pull_events()
+        separators = {self.keys.space: " ", self.keys.enter: "\n", self.keys.tab: "\t"}
+        typed = []
+        for event in list(self.backlog)[handled:]:
+            if event is None:
+                break
+            key = event[1]
+            if key in self.modifiers:
+                continue
+            if key in separators:
+                typed.append((event[3], separators[key]))
+            elif event[0] == "key" and hasattr(key, "char") and key.char and ord(key.char) < 128:
+                typed.append((event[3], key.char))
+            else:
                 if self.debug:
-                    print("Clipboard verification failed")
+                    print("Unknown keys typed during the replacement, leaving it as it is")
+                return None
+        return typed
+
+    def inject(self, delete_count, text):
+        """Replace delete_count characters before the cursor with text; False on failure.
+
+        Keys typed meanwhile reach the application between the injected ones.
+        One typed during the delete leaves a character at the end, its own or
+        one of the old text it kept from being deleted, so as many more are
+        deleted and the keys go after text. One typed during the insert lands
+        inside text, placed from the echoes that came before it, and the text
+        is retyped from there, until a round goes by with nothing typed.
+        """
+        handled = len(self.backlog)
+        while True:
+            while delete_count:
+                self.injector.delete(delete_count)
+                typed = self.typed_since(handled)
+                if typed is None:
+                    return False
+                handled = len(self.backlog)
+                delete_count = len(typed)
+                text += "".join(char for _, char in typed)
+            if not text:
+                return True
+
+            start = self.tracker.echoes
+            if not self.injector.insert(text):
                 return False
-
-            # Paste using Ctrl+V
-            with self.keyboard_controller.pressed(Key.ctrl):
-                self.keyboard_controller.press('v')
-                self.keyboard_controller.release('v')
-
-            # Wait for paste operation to complete
-            time.sleep(0.1)
-
-            # Restore original clipboard after a short delay
-            threading.Timer(1.0, self.restore_clipboard).start()
-
+            typed = self.typed_since(handled)
+            if typed is None:
+                return False
+            handled = len(self.backlog)
+            if not typed:
+                return True
+
+            # What the field holds now, from where each key landed
+            landed = sorted((self.injector.landing(max(echoes - start, 0), text, char) for echoes, char in typed),
+                            key=lambda item: item[0])
+            screen = ""
+            done = 0
+            for where, put in landed:
+                screen += text[done:where] + put
+                done = where
+            screen += text[done:]
+            wanted = text + "".join(char for _, char in typed)
+            common = 0
+            while common < min(len(screen), len(wanted)) and screen[common] == wanted[common]:
+                common += 1
+            if common == len(screen) == len(wanted):
+                return True
             if self.debug:
-                print("Successfully typed using pyperclip")
-            return True
-
-        except Exception as e:
+                print(f"Keys typed during the replacement, retyping '{wanted[common:]}'")
+            self.metrics.count("repairs")
+            delete_count, text = len(screen) - common, wanted[common:]
+
+    def render_word(self, after="", final=False):
+        """Incremental mode: edit what is shown for the word into its conversion.
+
+        Only the part after the common prefix is backspaced and retyped. While
+        more keys are queued the edit waits for them, so a fast burst costs one
+        edit; after is the separator just typed, for the word's final edit,
+        and final marks one that ends the word without a separator (F12).
+        """
+        final = final or bool(after)
+        if not final and self.events_pending():
+            return
+        tail = self.typed_ahead() if final else ""
+        if tail is None:
             if self.debug:
-                print(f"Pyperclip method failed: {e}")
-            # Try to restore clipboard even if there was an error
-            self.restore_clipboard()
-            return False
+                print("Unknown keys typed after the word, leaving it as shown")
+            self.metrics.count("skipped_words")
+            return
 
-    def process_current_word_reliable(self):
-        if not self.current_word:
+        if self.passes_through(self.word.keys):
+            target = self.word.keys
+        else:
+            target = self.convert_bijoy(self.word.bijoy())
+        shown = self.shown
+        common = 0
+        while common < len(shown) and common < len(target) and shown[common] == target[common]:
+            common += 1
+        if common == len(shown) == len(target):
             return
 
-        self.is_processing = True
+        delete_count = len(shown) - common + len(after) + len(tail)
+        text = target[common:] + after + tail
+        if self.debug:
+            print(f"Showing '{target}' for '{self.word.keys}': {delete_count} backspaces, typing '{text}'")
+
+        self.state = REPLACING
         try:
-            original_word = self.current_word
-            mapped_word = interpreter(original_word)
+            done = self.inject(delete_count, text)
+        finally:
+            self.state = TYPING
+        if done:
+            self.shown = target
+        else:
+            if self.debug:
+                print(f"{self.injector.name} injection failed, word left as shown")
+            self.metrics.count("injection_failures")
+
+    def convert_bijoy(self, bijoy):
+        """Unicode for a Bijoy-encoded word through the word cache, counting hits when measured."""
+        if not self.metrics:
+            return self.converter.convert_bijoy_word(bijoy)
+        hits = self.converter.convert_bijoy_word.cache_info().hits
+        with self.metrics.time("convert"):
+            unicode = self.converter.convert_bijoy_word(bijoy)
+        hit = self.converter.convert_bijoy_word.cache_info().hits > hits
+        self.metrics.count("cache_hits" if hit else "cache_misses")
+        return unicode
+
+    def process_current_word_reliable(self, original_word):
+        try:
+            self.metrics.count("words")
+            with self.metrics.time("map"):
+                bijoy_word = self.converter.map_keys(original_word)
+            mapped_word = self.convert_bijoy(bijoy_word)
 
             if self.debug:
                 print(f"Original input: '{original_word}'")
                 print(f"Interpreter output: '{mapped_word}'")
+                print(f"Word cache: {self.converter.convert_bijoy_word.cache_info()}")
 
             text_to_type = self.process_mapping(original_word, mapped_word)
 
@@ -206,52 +482,38 @@ class BijoyMapper:
                     print("No changes made. Skipping.")
                 return
 
-            word_length = len(original_word)
+            tail = self.typed_ahead()
+            if tail is None:
+                if self.debug:
+                    print("Unknown keys typed after the word, skipping replacement")
+                self.metrics.count("skipped_words")
+                return
 
+            # Delete the original word + space (+ anything typed since) and type the new text + space
+            total_to_delete = len(original_word) + 1 + len(tail)
             if self.debug:
-                print(f"Will delete {word_length} chars and type '{text_to_type}'")
+                print(f"Deleting {total_to_delete} characters (word + space) and typing '{text_to_type}' with {self.injector.name}")
 
-            # Wait a bit for any pending keystrokes to complete
-            time.sleep(0.1)
-
-            # Delete the original word + space
-            total_to_delete = word_length + 1
-            if self.debug:
-                print(f"Deleting {total_to_delete} characters (word + space)")
-
-            for i in range(total_to_delete):
-                self.keyboard_controller.press(Key.backspace)
-                self.keyboard_controller.release(Key.backspace)
-                time.sleep(0.01)
-
-            # Wait before typing new text
-            time.sleep(0.1)
-            
-            # Type the new text using pyperclip
-            if not self.type_with_pyperclip(text_to_type):
+            if not self.inject(total_to_delete, text_to_type + " " + tail):
                 if self.debug:
-                    print("Pyperclip method failed, skipping replacement")
+                    print(f"{self.injector.name} injection failed, skipping replacement")
+                self.metrics.count("injection_failures")
                 return
 
-            # Add space after the new text
-            time.sleep(0.1)
-            self.keyboard_controller.press(Key.space)
-            self.keyboard_controller.release(Key.space)
-
             if self.debug:
                 print(f"Replaced '{original_word}' + space with '{text_to_type}' + space")
 
         except Exception as e:
             print(f"Error in reliable processing: {e}")
-        finally:
-            self.is_processing = False
-            # Clear current word buffer
-            self.current_word = ""
+            self.metrics.count("errors")
+
+    def stop(self, timeout=1.0):
+        self.events.put(None)
+        self.worker.join(timeout)
 
     def run(self):
         try:
             print("Bijoy Mapper is ready. Use F12 to toggle on/off.")
-            print("Make sure pyperclip is installed: pip install pyperclip")
             self.keyboard_listener.join()
             self.mouse_listener.join()
         except KeyboardInterrupt:
@@ -263,4 +525,5 @@ class BijoyMapper:
             if hasattr(self, 'keyboard_listener'):
                 self.keyboard_listener.stop()
             if hasattr(self, 'mouse_listener'):
-                self.mouse_listener.stop()
\ No newline at end of file
+                self.mouse_listener.stop()
+            self.stop()
\ No newline at end of file
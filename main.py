@@ -1,13 +1,219 @@
-from listener import BijoyMapper
+import argparse
+import importlib.util
+import io
+import os
+import sys
+
+# Only the interactive mapper needs these; batch conversion never imports them
+INTERACTIVE_DEPENDENCIES = ("pynput", "pyperclip")
+
+# Function keys every pynput backend has; F12 turns the mapper on and off
+LAYOUT_KEYS = tuple(f"f{n}" for n in range(1, 21) if n != 12)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bijoy Keyboard Mapper")
+    parser.add_argument("--inject", choices=["type", "paste", "select-paste"], default="paste",
+                        help="how converted words are put on screen (default: paste)")
+    parser.add_argument("--clipboard", choices=["pyperclip", "tk"], default="pyperclip",
+                        help="clipboard backend for the paste strategies (default: pyperclip)")
+    parser.add_argument("--no-preserve-clipboard", action="store_true",
+                        help="skip clipboard backup, verification and restore; one copy per word")
+    parser.add_argument("--incremental", action="store_true",
+                        help="convert the word on screen with every key instead of at the space")
+    parser.add_argument("--debug", action="store_true", help="print every step of the live mapper")
+    parser.add_argument("--stats", metavar="FILE", help="write stage latencies and counters to FILE as JSON")
+    parser.add_argument("--stats-port", type=int, metavar="PORT",
+                        help="serve stage latencies and counters on http://127.0.0.1:PORT/")
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="seconds between writes of the stats file (default: 5)")
+    parser.add_argument("--record", metavar="FILE", help="record every key and click to FILE for replay.py")
+    parser.add_argument("--layout", action="append", default=[], metavar="FILE",
+                        help="add a layout JSON file; the first one given is active (repeatable)")
+    parser.add_argument("--layout-key", type=str.lower, choices=LAYOUT_KEYS, default="f9", metavar="KEY",
+                        help="function key that switches to the next layout, f1 to f20 but not f12 (default: f9)")
+    parser.add_argument("--watch-layouts", action="store_true", help="reload layout files when they change")
+    parser.add_argument("--english", metavar="FILE", help="words to leave in English, one per line")
+    parser.add_argument("--engine", choices=["reference", "fast"],
+                        help="conversion engine: the staged pipeline or the compiled tables, which convert at about "
+                             "the same speed (default: reference)")
+    parser.add_argument("--shadow", type=float, metavar="FRACTION",
+                        help="also run this fraction of the inputs through the other engine and log differences")
+    parser.add_argument("--shadow-log", metavar="FILE", help="where shadow mode logs differences "
+                                                             "(default: shadow-mismatches.jsonl)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    convert = subparsers.add_parser("convert", help="convert Bijoy text from a file or stdin to Unicode, or back")
+    convert.add_argument("input", nargs="?", default="-", help="input file (default: stdin)")
+    convert.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    direction = convert.add_mutually_exclusive_group()
+    direction.add_argument("--keys", action="store_true", help="input is Bijoy keystrokes rather than Bijoy-encoded text")
+    direction.add_argument("--to-bijoy", action="store_true", help="convert Unicode text back to Bijoy encoding")
+    direction.add_argument("--detect", action="store_true",
+                           help="input mixes Bijoy, Unicode and English; convert only the lines found to be Bijoy")
+    convert.add_argument("--encoding", default="utf-8", help="input encoding (default: utf-8)")
+    convert.add_argument("--output-encoding", default="utf-8", help="output encoding (default: utf-8)")
+    convert.add_argument("--chunk-size", type=int, default=64 * 1024, help="characters read per step")
+    convert.add_argument("-j", "--workers", type=int, default=1, help="worker processes; 0 uses every core (default: 1)")
+    convert.add_argument("--pattern", default="*.txt", help="file pattern when INPUT is a directory (default: *.txt)")
+    convert.add_argument("--progress", action="store_true", help="report progress on stderr")
+
+    serve = subparsers.add_parser("serve", help="run the local conversion server (see server.py)")
+    serve.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    serve.add_argument("--host", default="127.0.0.1", help="TCP address (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765)")
+    serve.add_argument("-j", "--workers", type=int, default=0, help="worker processes; 0 uses every core (default)")
+    serve.add_argument("--batch-delay", type=float, default=0.002,
+                       help="seconds a text waits for others to batch with (default: 0.002)")
+
+    compile_ = subparsers.add_parser("compile", help="rebuild the compiled layout, character maps and transducer")
+    compile_.add_argument("layout", nargs="?", help="layout JSON file (default: bijoyClassic_parsed.json)")
+    return parser.parse_args(argv)
+
+
+def apply_engine_settings(args):
+    """Hand the engine settings on through the environment, which worker processes inherit."""
+    from interpreter import ENGINE_VARIABLE, SHADOW_LOG_VARIABLE, SHADOW_VARIABLE
+
+    for variable, value in ((ENGINE_VARIABLE, args.engine), (SHADOW_VARIABLE, args.shadow),
+                            (SHADOW_LOG_VARIABLE, args.shadow_log)):
+        if value is not None:
+            os.environ[variable] = str(value)
+
+
+def print_shadow_reports(converters):
+    for converter in converters:
+        if hasattr(converter.engine, "summary"):
+            print(converter.engine.summary(), file=sys.stderr)
+
+
+def print_progress(done, path=None):
+    print(f"\r{done} characters converted" + (f" ({path})" if path else ""), end="", file=sys.stderr, flush=True)
+
+
+def encoding_error(e, encoding):
+    char = e.object[e.start:e.end]
+    return (f"convert: {char!r} (U+{ord(char[0]):04X}) cannot be written in {encoding}; "
+            "choose another --output-encoding")
+
+
+def run_convert(args):
+    from stream import convert_stream
+
+    progress = print_progress if args.progress else None
+    workers = args.workers or None
+
+    if os.path.isdir(args.input):
+        from parallel import convert_tree
+        if args.output == "-":
+            sys.exit("convert: an output directory is required when INPUT is a directory")
+        try:
+            convert_tree(args.input, args.output, workers, args.keys, args.encoding, args.pattern, args.chunk_size,
+                         progress, args.to_bijoy, args.output_encoding, args.detect)
+        except UnicodeEncodeError as e:
+            sys.exit(encoding_error(e, args.output_encoding))
+        if progress:
+            print(file=sys.stderr)
+        return
+
+    try:
+        if args.input == "-":
+            reader = io.TextIOWrapper(sys.stdin.buffer, encoding=args.encoding)
+        else:
+            reader = open(args.input, "r", encoding=args.encoding)
+        if args.output == "-":
+            writer = io.TextIOWrapper(sys.stdout.buffer, encoding=args.output_encoding)
+        else:
+            writer = open(args.output, "w", encoding=args.output_encoding)
+    except OSError as e:
+        sys.exit(f"convert: cannot open {e.filename}: {e.strerror}")
 
-if __name__ == "__main__":
     try:
-        import pyperclip
-    except ImportError:
-        print("Installing pyperclip...")
-        import subprocess
-        subprocess.check_call(["pip", "install", "pyperclip"])
-        import pyperclip
-
-    mapper = BijoyMapper()
-    mapper.run()
\ No newline at end of file
+        with reader, writer:
+            if args.workers == 1:
+                convert_stream(reader, writer, args.keys, args.chunk_size, reverse=args.to_bijoy, detect=args.detect,
+                               progress=progress)
+            else:
+                from parallel import convert_parallel
+                convert_parallel(reader, writer, workers, args.keys, args.chunk_size, progress=progress,
+                                 reverse=args.to_bijoy, detect=args.detect)
+    except UnicodeEncodeError as e:
+        # A half-written file would pass for a converted one
+        if args.output != "-":
+            os.remove(args.output)
+        sys.exit(encoding_error(e, args.output_encoding))
+    if progress:
+        print(file=sys.stderr)
+
+
+def run_compile(args):
+    from converter import loadCharMapPlans
+    from interpreter import LAYOUT_PATH, load_layout
+    from transducer import load_transducer
+
+    loadCharMapPlans(rebuild=True)
+    load_layout(args.layout or LAYOUT_PATH, rebuild=True)
+    load_transducer(args.layout or LAYOUT_PATH, rebuild=True)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    apply_engine_settings(args)
+    if args.command == "convert":
+        run_convert(args)
+        if args.shadow and args.workers == 1:
+            # Worker processes keep their own counts; their mismatches are in the log
+            from interpreter import get_default_converter
+            print_shadow_reports([get_default_converter()])
+        sys.exit(0)
+    if args.command == "serve":
+        from server import run
+        run(args.workers or None, args.host, args.port, args.socket, args.batch_delay, args.debug)
+        sys.exit(0)
+    if args.command == "compile":
+        run_compile(args)
+        sys.exit(0)
+
+    missing = [name for name in INTERACTIVE_DEPENDENCIES if importlib.util.find_spec(name) is None]
+    if missing:
+        sys.exit(f"Missing dependencies: {', '.join(missing)}\nInstall them with: pip install -r requirements.txt")
+
+    from listener import BijoyMapper
+
+    metrics = None
+    if args.stats or args.stats_port:
+        from metrics import Metrics, start_stats_file, start_stats_server
+        metrics = Metrics()
+        if args.stats:
+            start_stats_file(metrics, args.stats, args.stats_interval)
+        if args.stats_port:
+            start_stats_server(metrics, args.stats_port)
+
+    recorder = None
+    if args.record:
+        from replay import SessionRecorder
+        recorder = SessionRecorder(args.record)
+
+    from interpreter import LAYOUT_PATH
+    from layouts import LayoutRegistry
+    layouts = LayoutRegistry(args.layout, args.debug)
+    layouts.add(LAYOUT_PATH)
+    if args.watch_layouts:
+        layouts.watch()
+
+    english = None
+    if args.english:
+        from router import load_words
+        english = load_words(args.english)
+
+    mapper = BijoyMapper(args.inject, args.clipboard, not args.no_preserve_clipboard, args.incremental,
+                         args.debug, metrics, recorder=recorder, layouts=layouts, layout_key=args.layout_key,
+                         english=english)
+    mapper.run()
+    if args.shadow:
+        print_shadow_reports(layouts.converters.values())
+    if recorder:
+        recorder.close()
+    if args.stats:
+        from metrics import write_stats
+        write_stats(metrics, args.stats)
@@ -0,0 +1,174 @@
+"""Latency histograms and counters for the live mapper.
+
+Components take a metrics object and call metrics.time(stage) around a stage
+and metrics.count(name) for events. NULL_METRICS does nothing, so with
+metrics off each call site costs one no-op method call.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Bucket i holds latencies below 2**i microseconds; the last one everything above ~1 s
+BUCKETS = 21
+
+
+class Histogram:
+    """Latencies in power-of-two microsecond buckets."""
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding that fraction of samples."""
+        if not self.count:
+            return 0.0
+        needed = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= needed:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p90_ms": self.percentile(0.9) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+            "buckets_us": {f"<{2 ** i}": n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class StageTimer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Thread-safe latency histograms per stage plus named counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def time(self, stage):
+        return StageTimer(self, stage)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "counters": dict(self.counters),
+                "stages": {stage: h.snapshot() for stage, h in self.histograms.items()},
+            }
+
+    def __bool__(self):
+        return True
+
+
+class NullMetrics:
+    """Stands in for Metrics when they are off."""
+
+    _nothing = nullcontext()
+
+    def time(self, stage):
+        return self._nothing
+
+    def record(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def __bool__(self):
+        return False
+
+
+NULL_METRICS = NullMetrics()
+
+
+def write_stats(metrics, path):
+    """Write a snapshot as JSON, replacing the file in one step."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metrics.snapshot(), f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def start_stats_file(metrics, path, interval=5.0):
+    """Rewrite path with a snapshot every interval seconds from a daemon thread."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                write_stats(metrics, path)
+            except OSError as e:
+                print(f"Failed to write stats: {e}")
+        write_stats(metrics, path)
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
+
+
+def start_stats_server(metrics, port, host="127.0.0.1"):
+    """Serve snapshots as JSON on http://host:port/ from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(metrics.snapshot(), indent=2, sort_keys=True).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,87 @@
+import fnmatch
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import stream
+from interpreter import get_default_converter
+
+
+def _convert_chunk(chunk, reverse=False):
+    return stream.convert_words(chunk, reverse)
+
+
+def _convert_file(paths):
+    input_path, output_path, keys, encoding, chunk_size, reverse, output_encoding, detect = paths
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    return input_path, stream.convert_file(input_path, output_path, keys, encoding, chunk_size, reverse,
+                                           output_encoding, detect)
+
+
+def convert_parallel(reader, writer, workers=None, keys=False, chunk_size=stream.CHUNK_SIZE,
+                     max_chunk_size=stream.MAX_CHUNK_SIZE, progress=None, reverse=False, detect=False):
+    """Convert one large stream over a process pool, writing results in input order.
+
+    Chunks are cut on the same safe boundaries as stream.convert_stream, and at
+    most two chunks per worker are in flight so memory stays bounded.
+    """
+    blocks = stream.read_chunks(reader, chunk_size)
+    if keys:
+        # Keystroke mapping is cheap next to conversion, so it stays in this process
+        converter = get_default_converter()
+        blocks = (converter.map_keys(block) for block in stream.split_lines(blocks, max_chunk_size))
+
+    if detect:
+        # Detection is cheap next to conversion and needs the lines before, so it stays in this process
+        from detect import BIJOY, route
+        chunks = route(blocks, max_chunk_size)
+    else:
+        is_safe = stream.is_safe_unicode_boundary if reverse else stream.is_safe_boundary
+        chunks = ((None, chunk) for chunk in stream.split_safe(blocks, max_chunk_size, is_safe))
+
+    workers = workers or os.cpu_count() or 1
+    window = 2 * workers
+    done = 0
+    with Pool(workers) as pool:
+        pending = deque()
+        for kind, chunk in chunks:
+            if detect and kind != BIJOY:
+                pending.append((len(chunk), chunk))  # Passes through as it is
+            else:
+                pending.append((len(chunk), pool.apply_async(_convert_chunk, (chunk, reverse))))
+            while len(pending) >= window:
+                size, result = pending.popleft()
+                writer.write(result if isinstance(result, str) else result.get())
+                done += size
+                if progress:
+                    progress(done)
+        while pending:
+            size, result = pending.popleft()
+            writer.write(result if isinstance(result, str) else result.get())
+            done += size
+            if progress:
+                progress(done)
+
+
+def find_files(input_dir, pattern="*.txt"):
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if fnmatch.fnmatch(name, pattern):
+                yield os.path.join(root, name)
+
+
+def convert_tree(input_dir, output_dir, workers=None, keys=False, encoding="utf-8", pattern="*.txt",
+                 chunk_size=stream.CHUNK_SIZE, progress=None, reverse=False, output_encoding="utf-8", detect=False):
+    """Convert every matching file under input_dir into the same layout under output_dir."""
+    jobs = []
+    for input_path in find_files(input_dir, pattern):
+        output_path = os.path.join(output_dir, os.path.relpath(input_path, input_dir))
+        jobs.append((input_path, output_path, keys, encoding, chunk_size, reverse, output_encoding, detect))
+
+    done = 0
+    with Pool(workers) as pool:
+        for input_path, size in pool.imap_unordered(_convert_file, jobs):
+            done += size
+            if progress:
+                progress(done, input_path)
@@ -0,0 +1,291 @@
+"""Record typing sessions and replay them against the mapper without a display.
+
+    python main.py --record session.jsonl              # record while typing for real
+    python replay.py session.jsonl                     # replay at the recorded pace
+    python replay.py session.jsonl --max-speed         # as fast as the mapper handles events
+    python replay.py --typed words.txt --interval 0.05 # synthesize a session from keystrokes
+    python replay.py --check                           # replay the built-in sessions below
+
+A session is JSON lines of {"t": seconds since start, "event": "key", "key": name}
+or {"t": ..., "event": "click"}; a key is its character, or the pynput name of
+a special key. Replays run BijoyMapper against fakes.FakeController and
+FakeClipboard and report throughput, per-word latency, dropped keys and
+whether the final text is what the keystrokes should have produced.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from metrics import Metrics
+from router import is_link
+
+# Symbols typed with Shift on a US keyboard
+SHIFTED = '~!@#$%^&*()_+{}|:"<>?'
+
+# Keystrokes --check replays; the first ends mid-word, which only stop() converts in incremental mode
+CHECK_SESSIONS = [
+    "Avwg evsjvq Mvb MvB",
+    "Avwg\nevsjvq\tMvb http://example.com MvB\n",
+]
+
+
+def key_name(key):
+    char = getattr(key, "char", None)
+    if char:
+        return char
+    return getattr(key, "name", None) or str(key)
+
+
+class SessionRecorder:
+    """Appends the user's keys and clicks to a session file as they happen."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def write(self, event):
+        event["t"] = round(time.perf_counter() - self.start, 6)
+        with self.lock:
+            self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def key(self, key):
+        self.write({"event": "key", "key": key_name(key)})
+
+    def click(self):
+        self.write({"event": "click"})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def load_session(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthesize(keystrokes, interval=0.1):
+    """A session that turns the mapper on and types keystrokes, one key every interval seconds.
+
+    Capitals and shifted symbols come after a Shift press, as a recording has them.
+    """
+    names = {" ": "space", "\n": "enter", "\t": "tab"}
+    events = [{"t": 0.0, "event": "key", "key": "f12"}]
+    for i, char in enumerate(keystrokes, 1):
+        t = round(i * interval, 6)
+        if char.isupper() or char in SHIFTED:
+            events.append({"t": t, "event": "key", "key": "shift"})
+        events.append({"t": t, "event": "key", "key": names.get(char, char)})
+    return events
+
+
+def expected_text(events, converter, incremental=False):
+    """The text a session should leave on screen, from the keys alone.
+
+    A word is converted at the space; in incremental mode it is converted as
+    it is typed, so it stays converted whatever ends it. Links stay as typed.
+    """
+    text = ""
+    word = ""
+    active = False
+
+    def convert(word):
+        return word if is_link(word) else converter.convert(word)
+
+    def shown():
+        return convert(word) if incremental and word else word
+
+    for event in events:
+        if event["event"] == "click":
+            text += shown()
+            word = ""
+            continue
+        name = event["key"]
+        if name == "f12":
+            text += shown()
+            word = ""
+            active = not active
+        elif len(name) == 1:
+            if active and ord(name) < 128:
+                word += name
+            else:
+                text += shown() + name
+                word = ""
+        elif name == "space":
+            text += (convert(word) if active and word else word) + " "
+            word = ""
+        elif name == "backspace":
+            if word:
+                word = word[:-1]
+            else:
+                text = text[:-1]
+        elif name in ("enter", "tab"):
+            text += shown() + ("\n" if name == "enter" else "\t")
+            word = ""
+    return text + shown()
+
+
+class ReplayMetrics(Metrics):
+    """Metrics that also keep every word latency, for exact percentiles."""
+
+    def __init__(self):
+        super().__init__()
+        self.word_latencies = []
+
+    def record(self, stage, seconds):
+        super().record(stage, seconds)
+        if stage == "word":
+            self.word_latencies.append(seconds)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def replay(events, strategy="paste", incremental=False, speed=1.0, preserve_clipboard=True, app_delay=0.0,
+           timeout=30.0, double_echo=False):
+    """Feed a session to a headless BijoyMapper.
+
+    At a given speed events go out on the recorded schedule, scaled, whether or
+    not the mapper keeps up. With speed None each event goes out as soon as the
+    previous one has been handled, which measures the mapper alone. With
+    double_echo the mapper's own keys come back twice, as on Xorg.
+    """
+    from fakes import FakeClipboard, FakeController, FakeKeys
+    from listener import BijoyMapper
+
+    metrics = ReplayMetrics()
+    clipboard = FakeClipboard()
+    controller = FakeController(clipboard, delay=app_delay, double_echo=double_echo)
+    mapper = BijoyMapper(strategy, clipboard, preserve_clipboard, incremental, metrics=metrics,
+                         controller=controller, keys=FakeKeys, listen=False)
+    # Every press reaches the listener after it reaches the field
+    controller.echo = mapper.on_key_press
+
+    start = time.perf_counter()
+    for event in events:
+        if speed:
+            delay = start + event["t"] / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if event["event"] == "click":
+            controller.drain()
+            mapper.on_mouse_click(0, 0, None, True)
+            if not speed:
+                mapper.events.join()
+            continue
+        # The key reaches the application, and through the echo the listener, as it would for real
+        key = FakeKeys.from_name(event["key"])
+        controller.press(key, injected=False)
+        controller.release(key)
+        if not speed:
+            controller.drain()
+            mapper.events.join()
+    # The last keys are on their way to the listener; stop() must not overtake them
+    controller.drain()
+    mapper.stop(timeout)
+    elapsed = time.perf_counter() - start
+
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    expected = expected_text(events, mapper.converter, incremental)
+    keys = sum(1 for event in events if event["event"] == "key")
+    return {
+        "keys": keys,
+        "words": counters.get("words", 0),
+        "seconds": elapsed,
+        "keys_per_sec": keys / elapsed if elapsed else float("inf"),
+        "word_latency_ms": {
+            "p50": percentile(metrics.word_latencies, 0.5) * 1000,
+            "p95": percentile(metrics.word_latencies, 0.95) * 1000,
+            "max": max(metrics.word_latencies, default=0.0) * 1000,
+        },
+        "dropped_keys": counters.get("dropped_keys", 0),
+        "skipped_words": counters.get("skipped_words", 0),
+        "failures": counters.get("injection_failures", 0) + counters.get("errors", 0),
+        "correct": controller.text == expected,
+        "text": controller.text,
+        "expected": expected,
+        "stages": snapshot["stages"],
+    }
+
+
+def check(interval=0.005, double_echo=False):
+    """Replay CHECK_SESSIONS with every strategy, whole-word and incremental; returns the failures."""
+    failures = []
+    for keystrokes in CHECK_SESSIONS:
+        events = synthesize(keystrokes, interval)
+        for strategy in ("type", "paste", "select-paste"):
+            for incremental in (False, True):
+                result = replay(events, strategy, incremental, double_echo=double_echo)
+                name = f"{strategy}{' --incremental' if incremental else ''} {keystrokes!r}"
+                print(f"{name:72} {'ok' if result['correct'] else 'WRONG'}")
+                if not result["correct"]:
+                    failures.append(f"{name} left {result['text']!r}, expected {result['expected']!r}")
+    return failures
+
+
+def report(result):
+    latency = result["word_latency_ms"]
+    print(f"keys           {result['keys']} in {result['seconds']:.3f} s ({result['keys_per_sec']:,.0f} keys/s)")
+    print(f"words          {result['words']}")
+    print(f"word latency   p50 {latency['p50']:.3f} ms   p95 {latency['p95']:.3f} ms   max {latency['max']:.3f} ms")
+    print(f"dropped keys   {result['dropped_keys']}   skipped words {result['skipped_words']}   "
+          f"failures {result['failures']}")
+    print(f"final text     {'ok' if result['correct'] else 'WRONG'}")
+    if not result["correct"]:
+        print(f"  got      {result['text']!r}")
+        print(f"  expected {result['expected']!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded typing session without a display")
+    parser.add_argument("session", nargs="?", help="session file from main.py --record")
+    parser.add_argument("--typed", metavar="FILE", help="synthesize the session from Bijoy keystrokes in FILE")
+    parser.add_argument("--interval", type=float,
+                        help="seconds between synthesized keys (default: 0.1, or 0.005 with --check)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor (default: 1, as recorded)")
+    parser.add_argument("--max-speed", action="store_true",
+                        help="send each event as soon as the previous one is handled")
+    parser.add_argument("--inject", choices=["type", "paste", "select-paste"], default="paste")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--no-preserve-clipboard", action="store_true")
+    parser.add_argument("--app-delay", type=float, default=0.0, help="seconds the fake application takes per key")
+    parser.add_argument("--double-echo", action="store_true",
+                        help="echo injected keys twice, flagged and then not, as pynput does on Xorg")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--check", action="store_true",
+                        help="replay the built-in sessions with every strategy and report any wrong text")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failures = check(args.interval or 0.005, args.double_echo)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        return 1 if failures else 0
+    if args.typed:
+        with open(args.typed, "r", encoding="utf-8") as f:
+            events = synthesize(f.read(), args.interval or 0.1)
+    elif args.session:
+        events = load_session(args.session)
+    else:
+        parser.error("a session file or --typed is required")
+
+    result = replay(events, args.inject, args.incremental, None if args.max_speed else args.speed,
+                    not args.no_preserve_clipboard, args.app_delay, double_echo=args.double_echo)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        report(result)
+    return 0 if result["correct"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Tell apart the parts of a text that need converting from those that pass through as they are.
+
+Only Bijoy text goes through the pipeline. A word piece (as stream.split_words
+cuts them) is first cut where it turns from Bijoy words to Unicode words or a
+link and back (segments), and each segment is one of:
+
+    BIJOY    Bijoy-encoded text; converted
+    UNICODE  already Unicode Bengali, possibly with ASCII mixed in; running it
+             through the rearrangement would move its kars again
+    LINK     a URL or an e-mail address
+    PLAIN    only characters no stage of the pipeline touches, so converting
+             it would give it back unchanged
+
+ASCII letters and digits are Bijoy codes, so an English word cannot be told
+from a Bijoy one by its characters; the live mapper takes a list of words to
+leave alone instead (load_words).
+"""
+import re
+
+import util
+from converter import charMaps
+
+BIJOY = "bijoy"
+UNICODE = "unicode"
+LINK = "link"
+PLAIN = "plain"
+
+
+def touched_chars():
+    """Every character that appears in a key of one of the conversion maps."""
+    chars = set()
+    for charMap in charMaps.values():
+        for srcKey in charMap:
+            chars.update(util.literalPattern(srcKey) or srcKey)
+    return chars
+
+
+_TOUCHED = touched_chars()
+_PASS = "".join(sorted(c for c in map(chr, range(32, 127)) if c not in _TOUCHED)) + "\t\r"
+# Bijoy codes outside ASCII; a piece holding one is Bijoy whatever else it has.
+# The zero-width joiners belong to Unicode Bengali as much as to the maps.
+_BIJOY_HIGH = "".join(sorted(c for c in _TOUCHED if ord(c) > 127 and not "ঀ" <= c <= "৿" and c not in "\u200c\u200d"))
+
+# A piece ends in at most one separator, and a single one matches no key on its own
+_PLAIN = re.compile("[%s]*[ \n]?" % re.escape(_PASS))
+# The taka sign is typed into Bijoy text as itself, so it says nothing about the encoding
+_BENGALI = re.compile("[ঀ-৲৴-৿]")
+_BIJOY_HIGH_CHAR = re.compile("[%s]" % re.escape(_BIJOY_HIGH))
+_LINK = re.compile(r"(?:[A-Za-z][A-Za-z0-9+.-]*://|www\.)\S+|[^\s@]+@[^\s@]+\.[A-Za-z]{2,}\S*")
+_LINK_START = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*://|www\.")
+
+# Anything in a text that might not be Bijoy; without one, every piece is
+_MAYBE_OTHER = re.compile(r"[ঀ-৲৴-৿]|://|www\.|@")
+
+# A word with the spaces after it; the first one also takes those before it
+_WORD = re.compile(r"\s*\S+\s*")
+
+
+def needs_routing(text):
+    """False when a single scan shows every piece of text is Bijoy or converts to itself."""
+    return _MAYBE_OTHER.search(text) is not None
+
+
+def segments(piece):
+    """Cut piece into runs of whole words that each hold a Bengali letter or are links, or each do neither.
+
+    A word keeps the whitespace after it, and the first one also the
+    whitespace before it; a piece of fewer than two words comes back whole.
+    Nothing else decides a cut, so a Bijoy word is converted apart from a
+    Unicode word or link before it even if it starts with a kar glyph.
+    """
+    words = _WORD.findall(piece)
+    if len(words) < 2:
+        return [piece]
+    runs = []
+    other = None
+    for word in words:
+        word_other = _BENGALI.search(word) is not None or is_link(word.strip())
+        if word_other is other:
+            runs[-1] += word
+        else:
+            runs.append(word)
+            other = word_other
+    return runs
+
+
+def classify(piece):
+    if _PLAIN.fullmatch(piece):
+        return PLAIN
+    if _BENGALI.search(piece):
+        return BIJOY if _BIJOY_HIGH_CHAR.search(piece) else UNICODE
+    if _LINK.fullmatch(piece.rstrip(" \n")):
+        return LINK
+    return BIJOY
+
+
+def is_link(keys):
+    """True for typed keys that are, or so far start like, a URL or an e-mail address."""
+    return _LINK_START.match(keys) is not None or _LINK.fullmatch(keys) is not None
+
+
+def load_words(path):
+    """Words to type as they are, one per line; matched without regard to case."""
+    with open(path, "r", encoding="utf-8") as f:
+        return frozenset(line.strip().lower() for line in f if line.strip())
@@ -0,0 +1,247 @@
+"""Local conversion service that keeps the converter loaded and its word caches warm.
+
+    python server.py                        # localhost TCP on DEFAULT_PORT
+    python server.py --socket /tmp/bijoy.sock
+    python main.py serve --port 9000 -j 4
+
+Clients send one JSON request per line and get one JSON response per line,
+matched by id; requests on a connection may be pipelined and answers can come
+back in any order:
+
+    {"id": 1, "op": "convert", "text": "Avwg"}         -> {"id": 1, "text": "আমি"}
+    {"id": 2, "op": "convert", "texts": ["Avwg", "Zzwg"]} -> {"id": 2, "texts": ["আমি", "তুমি"]}
+    {"id": 3, "op": "stats"}                          -> {"id": 3, "stats": {...}}
+
+op is "convert" (Bijoy text), "keys" (Bijoy keystrokes) or "to_bijoy"
+(Unicode back to Bijoy); a failed request gets {"id": ..., "error": message}.
+Small texts arriving together, from any connection, are collected for a few
+milliseconds and converted as one batch in a worker process, so the event
+loop only moves bytes and one round trip to the pool carries many requests.
+client.py is the matching client.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from client import DEFAULT_PORT
+from metrics import Metrics
+
+# How long a text may wait for others to share its batch, and how big a batch gets
+BATCH_DELAY = 0.002
+BATCH_CHARS = 64 * 1024
+
+# Longest request line accepted
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+OPS = ("convert", "keys", "to_bijoy")
+
+
+def _warm():
+    from interpreter import get_default_converter
+
+    converter = get_default_converter()
+    converter.convert("Avwg")
+    converter.convert_unicode("আমি")
+
+
+def _convert_batch(items):
+    """Convert (op, text) pairs in a worker; the word caches live on between batches.
+
+    An item that fails gets its exception in place of the text, so it fails
+    only the requests that asked for it.
+    """
+    import stream
+    from interpreter import get_default_converter
+
+    converter = get_default_converter()
+    results = []
+    for op, text in items:
+        try:
+            if op == "keys":
+                results.append(stream.convert_words(converter.map_keys(text)))
+            else:
+                results.append(stream.convert_words(text, reverse=op == "to_bijoy"))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class Batcher:
+    """Collects texts to convert and sends them to the executor in batches.
+
+    A batch goes out BATCH_DELAY after its first text or as soon as it holds
+    BATCH_CHARS characters. The same text asked for twice in a batch is
+    converted once.
+    """
+
+    def __init__(self, executor, delay=BATCH_DELAY, max_chars=BATCH_CHARS, metrics=None):
+        self.executor = executor
+        self.delay = delay
+        self.max_chars = max_chars
+        self.metrics = metrics or Metrics()
+        self.pending = {}
+        self.chars = 0
+        self.timer = None
+
+    def submit(self, op, text):
+        """A future for the converted text."""
+        if not isinstance(text, str):
+            # Checked before it joins the batch, which other requests share
+            raise TypeError(f"text must be a string, not {type(text).__name__}")
+        loop = asyncio.get_running_loop()
+        futures = self.pending.get((op, text))
+        if futures is None:
+            futures = self.pending[(op, text)] = []
+            self.chars += len(text)
+        else:
+            self.metrics.count("coalesced")
+        future = loop.create_future()
+        futures.append(future)
+        if self.chars >= self.max_chars:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.delay, self.flush)
+        return future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.chars = self.pending, {}, 0
+        if not batch:
+            return
+        self.metrics.count("batches")
+        self.metrics.count("batch_texts", len(batch))
+        started = time.perf_counter()
+        job = asyncio.get_running_loop().run_in_executor(self.executor, _convert_batch, list(batch))
+        job.add_done_callback(lambda job: self.deliver(batch, job, started))
+
+    def deliver(self, batch, job, started):
+        self.metrics.record("batch", time.perf_counter() - started)
+        error = job.exception()
+        results = [error] * len(batch) if error else job.result()
+        for futures, result in zip(batch.values(), results):
+            for future in futures:
+                if future.done():
+                    continue  # The client went away
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class ConversionServer:
+    """Answers conversion requests from any number of connections through one Batcher."""
+
+    def __init__(self, workers=None, delay=BATCH_DELAY, max_chars=BATCH_CHARS, debug=False):
+        self.metrics = Metrics()
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_warm)
+        self.batcher = Batcher(self.executor, delay, max_chars, self.metrics)
+        self.debug = debug
+
+    async def answer(self, request):
+        request_id = request.get("id")
+        op = request.get("op", "convert")
+        if op == "stats":
+            return {"id": request_id, "stats": self.metrics.snapshot()}
+        if op not in OPS:
+            return {"id": request_id, "error": f"unknown op {op!r}"}
+        if "texts" in request:
+            texts = request["texts"]
+            results = await asyncio.gather(*(self.batcher.submit(op, text) for text in texts))
+            return {"id": request_id, "texts": list(results)}
+        if "text" not in request:
+            return {"id": request_id, "error": "request has neither text nor texts"}
+        return {"id": request_id, "text": await self.batcher.submit(op, request["text"])}
+
+    async def handle_request(self, line, writer):
+        started = time.perf_counter()
+        request = None
+        try:
+            request = json.loads(line)
+            response = await self.answer(request)
+        except Exception as e:
+            request_id = request.get("id") if isinstance(request, dict) else None
+            response = {"id": request_id, "error": str(e) or type(e).__name__}
+            self.metrics.count("errors")
+        self.metrics.count("requests")
+        self.metrics.record("request", time.perf_counter() - started)
+        if not writer.is_closing():
+            writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        self.metrics.count("connections")
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # Each request runs on its own, so a pipelined burst shares batches
+                task = asyncio.create_task(self.handle_request(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, ValueError) as e:
+            if self.debug:
+                print(f"Connection dropped: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, path=None, ready=None):
+        if path:
+            server = await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_REQUEST_SIZE)
+            where = path
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_REQUEST_SIZE)
+            where = f"{host}:{server.sockets[0].getsockname()[1]}"
+        # Start every worker now, so the first requests do not pay for it
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(self.executor, _warm)
+                               for _ in range(self.workers)))
+        print(f"Conversion server listening on {where}")
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def run(workers=None, host="127.0.0.1", port=DEFAULT_PORT, path=None, delay=BATCH_DELAY, debug=False):
+    server = ConversionServer(workers, delay, debug=debug)
+    try:
+        asyncio.run(server.serve(host, port, path))
+    except KeyboardInterrupt:
+        print("Conversion server stopped")
+    finally:
+        server.close()
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Bijoy conversion server")
+    parser.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument("-j", "--workers", type=int, default=0, help="worker processes; 0 uses every core (default)")
+    parser.add_argument("--batch-delay", type=float, default=BATCH_DELAY,
+                        help=f"seconds a text waits for others to batch with (default: {BATCH_DELAY})")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args(argv)
+    run(args.workers or None, args.host, args.port, args.socket, args.batch_delay, args.debug)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Run one conversion engine for real and the other beside it on a sample of inputs.
+
+    python main.py --engine fast --shadow 0.05 convert legacy.txt -o unicode.txt
+    BIJOY_ENGINE=fast BIJOY_SHADOW=0.05 python server.py
+
+The primary engine's result is always the one used. For a sampled input the
+other engine runs as well, both are timed, and a difference is appended to the
+log as one JSON line with the input and both results; fuzz.py --replay LOG
+runs the logged inputs again. report() gives the counts and the reference
+engine's time over the fast one's on the sampled inputs.
+
+Each process keeps its own counts; worker processes of a batch job append
+their mismatches to the same log.
+"""
+import json
+import random
+import threading
+import time
+
+SHADOW_LOG = "shadow-mismatches.jsonl"
+
+
+class ShadowEngine:
+    """Stands in for the primary of engines ({name: engine}) and shadows a sample of its calls."""
+
+    def __init__(self, engines, primary, sample=0.01, log_path=None, seed=None):
+        self.engines = engines
+        self.primary = primary
+        self.other = next(name for name in engines if name != primary)
+        self.sample = sample
+        self.log_path = log_path or SHADOW_LOG
+        self.random = random.Random(seed).random
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.mismatches = 0
+        self.seconds = dict.fromkeys(engines, 0.0)
+
+    def run(self, op, text):
+        started = time.perf_counter()
+        result = getattr(self.engines[self.primary], op)(text)
+        if self.random() >= self.sample:
+            return result
+        elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            other = getattr(self.engines[self.other], op)(text)
+        except Exception as e:
+            # The shadow must never break the conversion it watches
+            other = f"<{type(e).__name__}: {e}>"
+        other_elapsed = time.perf_counter() - started
+
+        with self.lock:
+            self.samples += 1
+            self.seconds[self.primary] += elapsed
+            self.seconds[self.other] += other_elapsed
+            if other != result:
+                self.mismatches += 1
+                self.log({"op": op, "input": text, self.primary: result, self.other: other})
+        return result
+
+    def log(self, entry):
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Failed to log engine mismatch: {e}")
+
+    def map_keys(self, text):
+        return self.run("map_keys", text)
+
+    def convert_bijoy(self, text):
+        return self.run("convert_bijoy", text)
+
+    def convert(self, text):
+        return self.run("convert", text)
+
+    def report(self):
+        with self.lock:
+            reference, fast = self.seconds.get("reference", 0.0), self.seconds.get("fast", 0.0)
+            return {
+                "samples": self.samples,
+                "mismatches": self.mismatches,
+                "reference_seconds": reference,
+                "fast_seconds": fast,
+                "speedup": reference / fast if fast else None,
+            }
+
+    def summary(self):
+        report = self.report()
+        text = f"Shadow: {report['samples']} samples, {report['mismatches']} mismatches"
+        if report["speedup"]:
+            text += f", fast engine {report['speedup']:.2f}x the reference"
+        if report["mismatches"]:
+            text += f" (logged to {self.log_path})"
+        return text
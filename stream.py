@@ -0,0 +1,257 @@
+import os
+import re
+
+import router
+from converter import conversionMap
+from interpreter import get_default_converter
+
+# Characters read from the input per step and the most that may be buffered
+# while looking for a safe place to cut; text that goes longer without one is
+# cut anyway
+CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+_SAFE_LETTERS = set("অআইঈউঊঋঌএঐওঔকখগঘঙচছজঝঞটঠডঢণতথদধনপফবভমযলশষসহড়ঢ়য়ৎ০১২৩৪৫৬৭৮৯")
+
+# A chunk may start with anything that converts to a full letter or digit.
+# Refs, kars, halants, nukta and visarga all react to the text before them.
+SAFE_START = {key for key, value in conversionMap.items() if len(key) == 1 and value in _SAFE_LETTERS}
+SAFE_START.discard("i")  # র can start a ref
+
+# A chunk may end on a newline or a single space as long as no halant sits
+# right before it, otherwise a kar can be swapped across into the next chunk
+HALANT_END = {key for key, value in conversionMap.items() if value.endswith("্")} | set(" \t\\&")
+
+_WORD_END = re.compile("[ \n]")
+
+# preConversion folds these into a space or newline before them ('\n +', ' ,', ' \\|' ...)
+_FOLDED_AFTER_SPACE = set(" \n,|\\")
+
+# Unicode going to Bijoy moves a pre-kar back over the character before it
+# (more if a halant follows that one) and a ref forward over the character
+# after it, so a cut must not have a pre-kar (O and Ou-kar start with one) or
+# halant just after it or a halant just before it
+UNICODE_UNSAFE_START = set("িেৈোৌ্")
+
+
+def is_safe_boundary(text, k, separators="\n"):
+    """True if text can be cut before index k without splitting a conjunct, ref or kar sequence."""
+    if k < 2 or text[k - 1] not in separators or text[k] not in SAFE_START:
+        return False
+    return text[k - 2] == "\n" or text[k - 2] not in HALANT_END
+
+
+def is_safe_unicode_boundary(text, k, separators="\n"):
+    """is_safe_boundary for Unicode text on its way to Bijoy."""
+    if k < 2 or text[k - 1] not in separators or text[k] in UNICODE_UNSAFE_START:
+        return False
+    return text[k - 2] != "্"
+
+
+def split_words(text, is_safe=is_safe_boundary):
+    """Cut text after the spaces and newlines where each word converts on its own."""
+    start = 0
+    for match in _WORD_END.finditer(text):
+        k = match.end()
+        if k < len(text) and is_safe(text, k, " \n"):
+            yield text[start:k]
+            start = k
+    if start < len(text):
+        yield text[start:]
+
+
+def find_safe_boundary(text, is_safe=is_safe_boundary, separators="\n", start=0):
+    """Return the last safe cut in text just after one of separators, or 0 if there is none.
+
+    Cuts before start are not looked at.
+    """
+    start = max(start - 1, 0)
+    k = len(text) - 1
+    while True:
+        k = max(text.rfind(separator, start, k) for separator in separators)
+        if k <= 0:
+            return 0
+        if is_safe(text, k + 1, separators):
+            return k + 1
+
+
+def find_forced_boundary(text):
+    """Return the last cut just after a space or newline, or 0, that splits nothing preConversion folds.
+
+    Such a cut is not safe, since a kar or halant may still react across it.
+    """
+    k = len(text) - 1
+    while True:
+        k = max(text.rfind(" ", 0, k), text.rfind("\n", 0, k))
+        if k < 0:
+            return 0
+        if text[k + 1] not in _FOLDED_AFTER_SPACE:
+            return k + 1
+
+
+def read_chunks(reader, chunk_size=CHUNK_SIZE):
+    while True:
+        block = reader.read(chunk_size)
+        if not block:
+            return
+        yield block
+
+
+def split_lines(blocks, max_chunk_size=MAX_CHUNK_SIZE):
+    """Re-cut keystroke blocks just after a newline; no key in the layout spans one.
+
+    A line longer than max_chunk_size is cut after a space, or failing that
+    at max_chunk_size, where a key may be split in two.
+    """
+    pending = ""
+    for block in blocks:
+        # The pending text has no newline, so only the block needs looking at
+        searched = len(pending)
+        pending += block
+        k = pending.rfind("\n", searched) + 1
+        if not k and len(pending) > max_chunk_size:
+            # Only " c" and " C" contain a space, so a space not followed by c/C ends every key
+            k = len(pending) - 1
+            while True:
+                k = pending.rfind(" ", 0, k)
+                if k < 0 or pending[k + 1] not in "cC":
+                    break
+            k += 1
+            if len(pending) - k > max_chunk_size:
+                k = max_chunk_size
+        if k:
+            yield pending[:k]
+            pending = pending[k:]
+    if pending:
+        yield pending
+
+
+def split_safe(blocks, max_chunk_size=MAX_CHUNK_SIZE, is_safe=is_safe_boundary):
+    """Re-cut Bijoy text so that every piece converts the same as it would in place.
+
+    Text that runs past max_chunk_size without a safe cut at a line break is
+    cut anyway, at a safe one at a space, at any space or line break, or at
+    max_chunk_size itself; the output may differ from a whole conversion
+    around such a cut.
+    """
+    pending = ""
+    for block in blocks:
+        # The pending text has no safe cut at a line break, so only cuts into the block are new
+        searched = len(pending)
+        pending += block
+        k = find_safe_boundary(pending, is_safe, start=searched)
+        if not k and len(pending) > max_chunk_size:
+            k = find_safe_boundary(pending, is_safe, " \n") or find_forced_boundary(pending)
+            if len(pending) - k > max_chunk_size:
+                k = max_chunk_size
+        if k:
+            yield pending[:k]
+            pending = pending[k:]
+    if pending:
+        yield pending
+
+
+def piece_converter(text, reverse=False):
+    """The function each word piece of text goes through.
+
+    Bijoy pieces go through the word cache. When a scan of text finds
+    Unicode, links or other pieces that are not Bijoy, each piece is cut
+    into segments of one kind and those that are not Bijoy come back as they
+    are.
+    """
+    converter = get_default_converter()
+    if reverse:
+        return converter.convert_unicode_word
+    convert = converter.convert_bijoy_word
+    if not router.needs_routing(text):
+        return convert
+    classify = router.classify
+    segments = router.segments
+
+    def convert_piece(piece):
+        return "".join(convert(segment) if classify(segment) == router.BIJOY else segment
+                       for segment in segments(piece))
+
+    return convert_piece
+
+
+def convert_words(text, reverse=False):
+    convert = piece_converter(text, reverse)
+    return "".join(map(convert, split_words(text, is_safe_unicode_boundary if reverse else is_safe_boundary)))
+
+
+def convert_words_with_offsets(text, reverse=False):
+    """convert_words, plus the (source start, output start) of every piece converted on its own.
+
+    Refs and kars move only within a piece, so a source span made of whole
+    pieces maps to exactly the output span between their offsets.
+    """
+    convert = piece_converter(text, reverse)
+    pieces = split_words(text, is_safe_unicode_boundary if reverse else is_safe_boundary)
+    output = []
+    offsets = []
+    source_start = output_start = 0
+    for piece in pieces:
+        converted = convert(piece)
+        offsets.append((source_start, output_start))
+        output.append(converted)
+        source_start += len(piece)
+        output_start += len(converted)
+    return "".join(output), offsets
+
+
+def convert_chunks(blocks, keys=False, max_chunk_size=MAX_CHUNK_SIZE, reverse=False, detect=False):
+    """Convert an iterable of text blocks, yielding Unicode text in order.
+
+    With reverse the blocks are Unicode and Bijoy text comes out instead.
+    With detect only the lines detect.py takes for Bijoy are converted.
+    """
+    if detect:
+        from detect import convert_detected
+        yield from convert_detected(blocks, max_chunk_size)
+        return
+    if reverse:
+        for chunk in split_safe(blocks, max_chunk_size, is_safe_unicode_boundary):
+            yield convert_words(chunk, reverse=True)
+        return
+    if keys:
+        converter = get_default_converter()
+        blocks = (converter.map_keys(block) for block in split_lines(blocks, max_chunk_size))
+
+    # Prose repeats words heavily, so each chunk is converted word by word through the cache
+    for chunk in split_safe(blocks, max_chunk_size):
+        yield convert_words(chunk)
+
+
+def convert_stream(reader, writer, keys=False, chunk_size=CHUNK_SIZE, max_chunk_size=MAX_CHUNK_SIZE, reverse=False,
+                   detect=False, progress=None):
+    """Stream text from reader to writer and return the number of characters read.
+
+    Memory stays within a few chunks whatever the input size. progress, if
+    given, is called with the characters read so far after every write.
+    """
+    total = 0
+
+    def counted(blocks):
+        nonlocal total
+        for block in blocks:
+            total += len(block)
+            yield block
+
+    for text in convert_chunks(counted(read_chunks(reader, chunk_size)), keys, max_chunk_size, reverse, detect):
+        writer.write(text)
+        if progress:
+            progress(total)
+    return total
+
+
+def convert_file(input_path, output_path, keys=False, encoding="utf-8", chunk_size=CHUNK_SIZE, reverse=False,
+                 output_encoding="utf-8", detect=False):
+    with open(input_path, "r", encoding=encoding) as reader:
+        try:
+            with open(output_path, "w", encoding=output_encoding) as writer:
+                return convert_stream(reader, writer, keys, chunk_size, reverse=reverse, detect=detect)
+        except UnicodeEncodeError:
+            # A half-written file would pass for a converted one
+            os.remove(output_path)
+            raise
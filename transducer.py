@@ -0,0 +1,157 @@
+"""The keymap and the Bijoy character maps compiled into table-driven passes.
+
+    from transducer import get_default_transducer
+
+    fst = get_default_transducer()
+    fst.convert("Avwg")             # keystrokes to Unicode, as BijoyConverter.convert
+    fst.convert_bijoy("Avwg")       # Bijoy text to Unicode, as convertBijoyToUnicode
+
+Both mappings are compiled into the same shape: one scan finds the few keys
+longer than a character, and every other character goes through a
+str.translate table, so the work per character happens in C. The keymap's
+long keys become a regex factored like the key trie, which picks the same
+longest key map_input_string does. The special conjunct and conversion maps
+are merged into one, which is only done when util.isSinglePassSafe shows a
+single pass gives what running them in turn would. preConversion's rules look
+at their neighbours (doubled kars, runs of spaces) and stay a pass of their
+own, as do the rearrangement and postConversion.
+
+The tables are plain data, compiled once per layout and cached on disk like
+the layout itself.
+"""
+import os
+import re
+import threading
+
+import util
+from converter import Unicode, charMaps, conversion, postConversion, preConversion, specialJuktoConversion
+from interpreter import LAYOUT_PATH, build_key_trie, load_layout
+
+
+def trie_pattern(node):
+    """Regex source matching the longest key below a key trie node."""
+    branches = []
+    ends = []
+    for char, child in node.items():
+        if char is None:
+            continue
+        tail = trie_pattern(child)
+        if tail:
+            branches.append(re.escape(char) + tail)
+        else:
+            ends.append(re.escape(char))
+    if ends:
+        branches.append(ends[0] if len(ends) == 1 else "[" + "".join(ends) + "]")
+    if not branches:
+        return ""
+    # Every branch starts with its own character, so the only choice is how far
+    # to go; the greedy ? tries the longer key first and falls back to this one
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if None in node else pattern
+
+
+def compile_keys(key_map):
+    """(pattern, long keys, translate table) for map_input_string over key_map."""
+    long_keys = {key: value for key, value in key_map.items() if len(key) > 1}
+    table = {ord(key): value for key, value in key_map.items() if len(key) == 1}
+    # Where no long key starts, the longest match is the character's own key or the character
+    pattern = "(%s)" % trie_pattern(build_key_trie(long_keys)) if long_keys else None
+    return pattern, long_keys, table
+
+
+def overlaps(a, b):
+    """True when an occurrence of b can start inside or at the start of one of a."""
+    return any(a[k:].startswith(b) or b.startswith(a[k:]) for k in range(len(a)))
+
+
+def compile_bijoy():
+    """(units, translate table) for specialJuktoConversion then conversion, or None if they cannot be merged."""
+    special = charMaps["specialJuktoConversion"]
+    mapped = charMaps["conversion"]
+    if set(special) & set(mapped):
+        return None
+    merged = {**special, **mapped}
+    plan = util.planCharMap(merged)
+    if plan[0] != "single":
+        return None
+
+    table = plan[2]
+    singles = set()
+    units = []
+    for literal in map(util.literalPattern, merged):
+        if len(literal) == 1:
+            singles.add(literal)
+        elif literal[0] not in singles and literal not in units:
+            # Matched only if no single character before it in the map takes its first one
+            units.append(literal)
+    # Replacing the units one after another is the same as one alternation
+    # only when no two of them can overlap; their values hold no key characters
+    if any(overlaps(a, b) for a in units for b in units if a != b):
+        return None
+    return [(unit, table[unit]) for unit in units], {ord(c): table[c] for c in singles}
+
+
+def compile_transducer(layout_path):
+    layout, _ = load_layout(layout_path)
+    return compile_keys(layout["map"]["general"]), compile_bijoy()
+
+
+def load_transducer(layout_path=LAYOUT_PATH, rebuild=False):
+    """The compiled tables, reused until the layout JSON or the conversion maps change."""
+    name = "transducer-" + os.path.splitext(os.path.basename(layout_path))[0]
+    fingerprint = (util.fileFingerprint(layout_path), repr(charMaps))
+    return util.loadCached(name, fingerprint, lambda: compile_transducer(layout_path), rebuild)
+
+
+class Transducer:
+    """Converts through the compiled tables; results match BijoyConverter's."""
+
+    def __init__(self, layout_path=LAYOUT_PATH, rebuild=False):
+        (pattern, self.long_keys, self.key_table), bijoy = load_transducer(layout_path, rebuild)
+        self.key_pattern = re.compile(pattern) if pattern else None
+        self.units, self.bijoy_table = bijoy if bijoy else (None, None)
+        self.unicode = Unicode()
+
+    def map_keys(self, text):
+        """Bijoy keystrokes to Bijoy-encoded text."""
+        if self.key_pattern is None:
+            return text.translate(self.key_table)
+        # Long keys at odd positions, the text between them at even ones
+        parts = self.key_pattern.split(text)
+        parts[0::2] = [part.translate(self.key_table) for part in parts[0::2]]
+        parts[1::2] = [self.long_keys[part] for part in parts[1::2]]
+        return "".join(parts)
+
+    def map_bijoy(self, text):
+        """Bijoy-encoded text to Unicode in Bijoy order, before the rearrangement."""
+        text = preConversion(text)
+        if self.units is None:
+            return conversion(specialJuktoConversion(text))
+        for unit, value in self.units:
+            if unit in text:
+                text = text.replace(unit, value)
+        return text.translate(self.bijoy_table)
+
+    def convert_bijoy(self, text):
+        """Bijoy-encoded text to Unicode."""
+        if not text:
+            return text
+        return postConversion(self.unicode.reArrangeUnicodeConvertedText(self.map_bijoy(text)))
+
+    def convert(self, text):
+        """Bijoy keystrokes to Unicode."""
+        return self.convert_bijoy(self.map_keys(text))
+
+
+_default_transducer = None
+_default_transducer_lock = threading.Lock()
+
+
+def get_default_transducer():
+    """The shared transducer for the bundled layout, compiled on first use."""
+    global _default_transducer
+    if _default_transducer is None:
+        with _default_transducer_lock:
+            if _default_transducer is None:
+                _default_transducer = Transducer()
+    return _default_transducer
@@ -1,3 +1,5 @@
+import os
+import pickle
 import re
 
 def doCharMap(text, charMap):
@@ -23,4 +25,201 @@ def subString(string, frm, to):
 
 def preg_replace(srcKey, keyVal, text):
     #srcKey = "@"+srcKey+"@"
-    return re.sub(srcKey, keyVal, text)
\ No newline at end of file
+    return re.sub(srcKey, keyVal, text)
+
+REGEX_META = '.^$*+?{}[]|()'
+
+# returns the plain text matched by a charMap key, or None if the key is a real regex
+def literalPattern(srcKey):
+    literal = []
+    i = 0
+    while i < len(srcKey):
+        c = srcKey[i]
+        if c == '\\':
+            if i + 1 >= len(srcKey) or srcKey[i + 1].isalnum():
+                return None
+            literal.append(srcKey[i + 1])
+            i += 2
+            continue
+        if c in REGEX_META:
+            return None
+        literal.append(c)
+        i += 1
+    return ''.join(literal)
+
+# a single alternation gives the same result as running the keys one after
+# another only when no replacement can feed a later key and no later key can
+# start inside an earlier key's match
+def isSinglePassSafe(literals, replacements):
+    keyChars = set(''.join(literals))
+    for keyVal in replacements:
+        if keyChars.intersection(keyVal):
+            return False
+    for i, earlier in enumerate(literals):
+        for later in literals[i + 1:]:
+            for k in range(1, len(later)):
+                if earlier.startswith(later[k:]) or later[k:].startswith(earlier):
+                    return False
+    return True
+
+def sequentialCharMap(charMap):
+    rules = [(re.compile(srcKey), keyVal) for srcKey, keyVal in charMap.items()]
+    prefilter = re.compile('|'.join('(?:%s)' % srcKey for srcKey in charMap))
+
+    def applyRules(text):
+        # no key matches anywhere, so none of the rules can change text
+        if not prefilter.search(text):
+            return text
+        for pattern, keyVal in rules:
+            text = pattern.sub(keyVal, text)
+        return text
+
+    return applyRules
+
+# works out once how charMap can be applied; the plan is plain data so it can be cached on disk
+def planCharMap(charMap):
+    literals = [literalPattern(srcKey) for srcKey in charMap]
+    if None in literals or '' in literals:
+        return ('sequential', dict(charMap))
+
+    # expand the replacement templates exactly as re.sub would
+    table = {}
+    for literal, (srcKey, keyVal) in zip(literals, charMap.items()):
+        table.setdefault(literal, re.sub(srcKey, keyVal, literal))
+
+    if not isSinglePassSafe(literals, list(table.values())):
+        return ('sequential', dict(charMap))
+
+    # keep the map order, folding runs of single characters into one class
+    branches = []
+    run = []
+    for literal in literals:
+        if len(literal) == 1:
+            run.append(re.escape(literal))
+            continue
+        if run:
+            branches.append('[' + ''.join(run) + ']')
+            run = []
+        branches.append(re.escape(literal))
+    if run:
+        branches.append('[' + ''.join(run) + ']')
+    return ('single', '|'.join(branches), table)
+
+def charMapFromPlan(plan):
+    if plan[0] == 'sequential':
+        return sequentialCharMap(plan[1])
+
+    # single characters go through a str.translate table and only the longer
+    # keys through the regex; a longer key whose first character is an earlier
+    # single key never matches in the alternation, so it is left out
+    table = plan[2]
+    singles = {}
+    units = []
+    for literal in table:
+        if len(literal) == 1:
+            singles[ord(literal)] = table[literal]
+        elif ord(literal[0]) not in singles:
+            units.append(literal)
+    pattern = re.compile('|'.join(map(re.escape, units))) if units else None
+    lookup = table.__getitem__
+
+    def singlePassCharMap(text):
+        if pattern is not None:
+            text = pattern.sub(lambda m: lookup(m.group()), text)
+        return text.translate(singles)
+
+    return singlePassCharMap
+
+# compiles charMap once into a function equivalent to doCharMap(text, charMap)
+def compileCharMap(charMap):
+    return charMapFromPlan(planCharMap(charMap))
+
+# one left-to-right pass replacing the longest key found at each position;
+# unlike doCharMap the keys are plain text, not patterns
+def longestMatchCharMap(charMap):
+    keys = sorted(charMap, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(key) for key in keys))
+    lookup = charMap.__getitem__
+
+    def replaceLongest(text):
+        return pattern.sub(lambda m: lookup(m.group()), text)
+
+    return replaceLongest
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+
+# returns build() as saved on disk under name while fingerprint still matches,
+# otherwise builds it again and saves it for the next start
+def loadCached(name, fingerprint, build, rebuild=False):
+    path = os.path.join(CACHE_DIR, name + '.pickle')
+    if not rebuild:
+        try:
+            with open(path, 'rb') as f:
+                storedFingerprint, value = pickle.load(f)
+            if storedFingerprint == fingerprint:
+                return value
+        except Exception:
+            pass
+
+    value = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'wb') as f:
+            pickle.dump((fingerprint, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+    except OSError:
+        pass
+    return value
+
+# identifies the current contents of a source file without reading it
+def fileFingerprint(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+# a list split at a movable gap, so that edits near a cursor that walks the
+# text do not copy the whole string; positions behave like mbCharAt/subString
+class GapBuffer:
+
+    def __init__(self, text):
+        self.left = []
+        self.right = list(reversed(text))
+
+    def __len__(self):
+        return len(self.left) + len(self.right)
+
+    # same result as mbCharAt(str, i), including negative and missing indices
+    def charAt(self, i):
+        n = len(self.left) + len(self.right)
+        if i < 0:
+            i += n
+            if i < 0:
+                return None
+        elif i >= n:
+            return None
+        if i < len(self.left):
+            return self.left[i]
+        return self.right[n - 1 - i]
+
+    def slice(self, frm, to):
+        to = min(to, len(self))
+        return [self.charAt(i) for i in range(frm, to)]
+
+    def moveGap(self, i):
+        left = self.left
+        right = self.right
+        while len(left) > i:
+            right.append(left.pop())
+        while len(left) < i:
+            left.append(right.pop())
+
+    # replaces positions frm..to-1 with items; cost is the edit size plus the gap move
+    def replace(self, frm, to, items):
+        self.moveGap(frm)
+        right = self.right
+        for _ in range(to - frm):
+            right.pop()
+        self.left.extend(items)
+
+    def toString(self):
+        return ''.join(self.left) + ''.join(reversed(self.right))